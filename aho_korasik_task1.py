@@ -1,39 +1,294 @@
+import argparse
+import asyncio
+import codecs
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import shared_memory
+
+# Формат файла скомпилированного автомата (см. AhoKorasik.save):
+# заголовок (с флагами нормализации), символы алфавита в UTF-8 (с
+# выравниванием до 4 байт), затем массивы int32 в порядке _TABLES
+AUTOMATON_MAGIC = b'AHOK'
+AUTOMATON_VERSION = 3
+_HEADER = struct.Struct('=4sIIIIIIII')
+# Флаги нормализации в заголовке файла
+_CASE_INSENSITIVE = 1
+_ASCII_FOLDING = 2
+_BYTE_ORDER_MARK = 0x01020304
+_TABLES = ('delta', 'fail', 'out_start', 'out_patterns', 'out_lengths', 'out_first', 'out_link',
+           'parent', 'edge')
+DEFAULT_CHUNK_SIZE = 1 << 16  # Размер блока при потоковом чтении
+OFFLOAD_SIZE = 1 << 14  # С какого размера search_async отдаёт блок в executor
+# Двоичные входы, которые search просматривает по байтам без декодирования
+_BYTES_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Событие трассировки: тип, ID узла (состояния), символ, позиция (1-based)
+# и данные события (номер шаблона, ID узла fail-ссылки и т.п.)
+TraceEvent = namedtuple('TraceEvent', 'kind node_id char pos detail',
+                        defaults=(None, None, None, None))
+
+# Таблицы ссылок состояний (см. AhoKorasik.compile) без таблицы переходов
+_LinkTables = namedtuple('_LinkTables',
+                         'fail parent edge out_start out_patterns out_lengths out_first out_link')
+
+def print_trace(event):
+    """Наблюдатель, печатающий ход работы автомата (для обучения и отладки)"""
+    kind, node_id, char, pos, detail = event
+    if kind == 'add_pattern':
+        print(f"Добавляем шаблон '{detail[0]}' с номером {detail[1]}")
+    elif kind == 'new_node':
+        print(f"  Создаём новый узел с ID {node_id} для символа '{char}'")
+    elif kind == 'existing_node':
+        print(f"  Переходим в существующий узел с ID {node_id} для символа '{char}'")
+    elif kind == 'pattern_end':
+        print(f"  Шаблон '{detail}' завершён в узле с ID {node_id}.\n")
+    elif kind == 'fail_links_start':
+        print("Строим суффиксные ссылки (fail links)...")
+    elif kind == 'fail_link':
+        print(f"  Обрабатываем переход по символу '{char}'")
+        if detail:
+            print(f"    Устанавливаем fail-ссылку на узел с ID {detail} для символа '{char}'")
+        else:
+            print("    Устанавливаем fail-ссылку на корень")
+    elif kind == 'fail_links_done':
+        print("Суффиксные ссылки построены.\n")
+    elif kind == 'compiled':
+        print(f"Таблица переходов: {detail[0]} состояний x {detail[1]} столбцов.\n")
+    elif kind == 'search_start':
+        print(f"Начинаем поиск в тексте: '{detail}'")
+    elif kind == 'char':
+        print(f"\nОбрабатываем символ '{char}' (позиция {pos})")
+    elif kind == 'fail':
+        print(f"  Нет перехода по '{char}', следуем по fail-ссылке")
+    elif kind == 'goto':
+        print(f"  Переход по символу '{char}' успешен в узел с ID {node_id}")
+    elif kind == 'root':
+        print(f"  Переход по символу '{char}' не найден, возвращаемся в корень")
+    elif kind == 'match':
+        print(f"  Найдено совпадение: шаблон {detail} на позиции {pos}")
+    elif kind == 'search_done':
+        print("\nПоиск завершён.\n")
+
+def _iter_chunks(source, chunk_size, encoding):
+    """Разбиение источника на текстовые блоки
+
+    Источник - строка, двоичные данные (bytes, bytearray, memoryview, mmap),
+    файловый объект (текстовый или двоичный) или итерируемый объект из
+    блоков str/bytes. Строка и двоичные данные режутся на блоки по
+    chunk_size. Двоичные данные декодируются инкрементально, поэтому
+    многобайтовый символ на границе блоков не теряется; при encoding=None
+    блоки bytes выдаются как есть.
+    """
+    if isinstance(source, str):
+        chunks = (source[start:start + chunk_size] for start in range(0, len(source), chunk_size))
+    elif isinstance(source, _BYTES_TYPES):
+        view = memoryview(source).cast('B')
+        chunks = (view[start:start + chunk_size] for start in range(0, len(view), chunk_size))
+    elif hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(chunk_size), source.read(0))
+    else:
+        chunks = source
+
+    decoder = None
+    for chunk in chunks:
+        if encoding is not None and not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    if decoder is not None:
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+async def _aiter_chunks(source, chunk_size):
+    """Блоки асинхронного источника: объекта с корутиной read(n)
+    (asyncio.StreamReader) или асинхронного итерируемого объекта"""
+    if hasattr(source, 'read'):
+        while True:
+            chunk = await source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        async for chunk in source:
+            yield chunk
+
+# Символы за пределами плоскостей 0 и 1 не меняются ни при свёртке
+# регистра, ни при свёртке в ASCII, поэтому _fold_preimages их не перебирает
+_FOLDING_LIMIT = 0x20000
+
+def _fold_char(char, case_insensitive, ascii_folding):
+    """Свёртка символа в один символ; если она даёт несколько символов
+    (например, 'ß' -> 'ss'), символ не меняется, чтобы позиции в тексте
+    и длины шаблонов сохранялись"""
+    if case_insensitive:
+        folded = char.casefold()
+        if len(folded) != 1:
+            folded = char.lower()
+        if len(folded) == 1:
+            char = folded
+    if ascii_folding and not char.isascii() and unicodedata.decomposition(char):
+        base = ''.join(c for c in unicodedata.normalize('NFKD', char)
+                       if not unicodedata.combining(c))
+        if len(base) == 1 and base.isascii():
+            char = base.lower() if case_insensitive else base
+    return char
+
+@lru_cache(maxsize=None)
+def _fold_preimages(case_insensitive, ascii_folding):
+    """Свёрнутый символ -> символы, которые в него сворачиваются (кроме него самого)
+
+    Строится один раз на процесс для каждого набора опций перебором
+    кодовых точек (около 0.1 с).
+    """
+    preimages = {}
+    for code in range(_FOLDING_LIMIT):
+        if 0xD800 <= code <= 0xDFFF:
+            continue
+        char = chr(code)
+        folded = _fold_char(char, case_insensitive, ascii_folding)
+        if folded != char:
+            preimages.setdefault(folded, []).append(char)
+    return preimages
+
 class Node:
+    __slots__ = ('node_id', 'children', 'fail', 'output', 'output_link')
+
     def __init__(self, node_id):
         self.node_id = node_id  # Уникальный ID узла
         self.children = {}      # Дочерние узлы
         self.fail = None        # Суффиксная ссылка
-        self.output = []        # Список шаблонов
-        self.output_link = None # Явная выходная ссылка (пока не используем)
+        self.output = []        # Шаблоны, заканчивающиеся именно в этом узле
+        self.output_link = None # Ближайший по fail-цепочке узел с шаблонами
 
 class AhoKorasik:
-    def __init__(self):
-        """Инициализация автомата с корнем"""
+    def __init__(self, observer=None, case_insensitive=False, ascii_folding=False):
+        """Инициализация автомата с корнем
+
+        observer - функция, получающая TraceEvent на каждом шаге
+        add_pattern, build_fail_links, compile и search (например,
+        print_trace). Без наблюдателя эти методы работают по отдельной
+        ветке кода без каких-либо проверок и форматирования в циклах.
+
+        case_insensitive и ascii_folding включают нормализацию: шаблоны
+        сворачиваются (регистр, диакритика и совместимые формы вроде 'é',
+        'Ｅ' -> 'e') при добавлении, а compile вносит в таблицу алфавита
+        все символы, сворачивающиеся в символы шаблонов. Текст при поиске
+        не копируется и не преобразуется, позиции - позиции в исходном
+        тексте. Нормализованный автомат ищет только по таблице переходов
+        (compile вызывается автоматически) и не поддерживает байтовый режим.
+        """
         self.root = Node(0)  # Корень с уникальным ID
+        self.observer = observer
+        self.case_insensitive = case_insensitive
+        self.ascii_folding = ascii_folding
         self.node_counter = 0
         self.pattern_counter = 0  # Счётчик шаблонов
+        self.read_only = False    # Автомат загружен load(): доступен только поиск
+        # Скомпилированный автомат (заполняется в compile)
+        self.alphabet = None      # Символ -> номер столбца таблицы переходов
+        self.n_columns = 0        # Число столбцов (столбец 0 - прочие символы)
+        self.delta = None         # Плоская таблица переходов состояние x столбец
+        self.fail = None          # Суффиксная ссылка состояния
+        self.parent = None        # Родитель состояния в боре (у корня -1)
+        self.edge = None          # Код символа ребра из родителя (у корня -1)
+        self.out_start = None     # Начало списка выходов состояния в out_*
+        self.out_patterns = None  # Номера шаблонов выходов
+        self.out_lengths = None   # Длины шаблонов выходов
+        self.out_first = None     # Первое состояние с выходами в цепочке (или -1)
+        self.out_link = None      # Выходная ссылка состояния (или -1)
+        # Байтовый автомат (заполняется в compile_bytes): те же таблицы
+        # для UTF-8 представления шаблонов, столбец - класс байта
+        self.byte_classes = None      # Таблица bytes.translate: байт -> класс
+        self.byte_n_columns = 0
+        self.byte_delta = None
+        self.byte_out_start = None
+        self.byte_out_patterns = None
+        self.byte_out_lengths = None  # Длины шаблонов в байтах
+        self.byte_out_first = None
+        self.byte_out_link = None
+
+    def normalize(self, text):
+        """Текст после свёртки символов, заданной опциями автомата"""
+        if not (self.case_insensitive or self.ascii_folding):
+            return text
+        return ''.join(_fold_char(char, self.case_insensitive, self.ascii_folding)
+                       for char in text)
+
+    def _fold_alphabet(self, alphabet):
+        """Добавление в алфавит символов, сворачивающихся в его символы"""
+        if not (self.case_insensitive or self.ascii_folding):
+            return
+        preimages = _fold_preimages(self.case_insensitive, self.ascii_folding)
+        for char, column in list(alphabet.items()):
+            for original in preimages.get(char, ()):
+                alphabet[original] = column
+
+    def _check_writable(self):
+        """Ошибка при попытке изменить или перестроить загруженный автомат"""
+        if self.read_only:
+            raise RuntimeError("Загруженный автомат поддерживает только поиск")
 
     def add_pattern(self, pattern, index):
         """Добавление одного шаблона в дерево"""
-        print(f"Добавляем шаблон '{pattern}' с номером {index}")
+        self._check_writable()
+        self.delta = None  # Скомпилированные таблицы больше не актуальны
+        self.byte_delta = None
+        pattern = self.normalize(pattern)
+        if self.observer is not None:
+            return self._add_pattern_traced(pattern, index)
         node = self.root
         for char in pattern:
+            child = node.children.get(char)
+            if child is None:
+                self.node_counter += 1
+                child = node.children[char] = Node(self.node_counter)
+            node = child
+        node.output.append((index, len(pattern)))
+
+    def _add_pattern_traced(self, pattern, index):
+        """add_pattern с передачей событий наблюдателю"""
+        trace = self.observer
+        trace(TraceEvent('add_pattern', 0, detail=(pattern, index)))
+        node = self.root
+        for i, char in enumerate(pattern, 1):
             if char not in node.children:
                 self.node_counter += 1
                 node.children[char] = Node(self.node_counter)
-                print(f"  Создаём новый узел с ID {self.node_counter} для символа '{char}'")
+                trace(TraceEvent('new_node', self.node_counter, char, i))
             else:
-                print(f"  Переходим в существующий узел с ID {node.children[char].node_id} для символа '{char}'")
+                trace(TraceEvent('existing_node', node.children[char].node_id, char, i))
             node = node.children[char]
         node.output.append((index, len(pattern)))
-        print(f"  Шаблон '{pattern}' завершён в узле с ID {node.node_id}.\n")
+        trace(TraceEvent('pattern_end', node.node_id, detail=pattern))
 
     def build_fail_links(self):
-        """Построение суффиксных ссылок"""
-        from collections import deque
+        """Построение суффиксных ссылок
+
+        Наблюдатель (если есть) проверяется один раз на ребро бора, а не на
+        шаг подъёма по fail-ссылкам.
+        """
+        self._check_writable()
         queue = deque()
+        trace = self.observer
 
-        print("Строим суффиксные ссылки (fail links)...")
+        if trace is not None:
+            trace(TraceEvent('fail_links_start'))
         # Инициализация: дочерние узлы корня получают fail-ссылку на корень
         for child in self.root.children.values():
             child.fail = self.root
@@ -44,7 +299,6 @@ class AhoKorasik:
             current_node = queue.popleft()
 
             for char, child_node in current_node.children.items():
-                print(f"  Обрабатываем переход по символу '{char}'")
                 fail_node = current_node.fail
 
                 # Поднимаемся по fail-ссылкам, пока не найдём символ или не дойдём до корня
@@ -53,145 +307,1349 @@ class AhoKorasik:
 
                 if fail_node:
                     child_node.fail = fail_node.children[char]
-                    print(f"    Устанавливаем fail-ссылку на узел с ID {child_node.fail.node_id} для символа '{char}'")
                 else:
                     child_node.fail = self.root
-                    print(f"    Устанавливаем fail-ссылку на корень")
+                if trace is not None:
+                    trace(TraceEvent('fail_link', child_node.node_id, char,
+                                     detail=child_node.fail.node_id if fail_node else None))
 
-                # Наследуем выходные шаблоны
-                child_node.output += child_node.fail.output
+                # Выходная ссылка вместо копирования шаблонов fail-узла:
+                # ближайший узел fail-цепочки, в котором заканчивается шаблон
+                fail = child_node.fail
+                child_node.output_link = fail if fail.output else fail.output_link
 
                 queue.append(child_node)
-        print("Суффиксные ссылки построены.\n")
+        if trace is not None:
+            trace(TraceEvent('fail_links_done'))
+
+    def compile(self):
+        """Компиляция автомата в плотную таблицу переходов (ДКА)
+
+        Вызывается после build_fail_links. Каждому символу из шаблонов
+        назначается столбец таблицы, столбец 0 отводится под все прочие
+        символы. Для каждого состояния (ID узла) заранее вычисляется полная
+        функция переходов с учётом fail-ссылок, поэтому поиск выполняет
+        ровно одно обращение к таблице на символ текста.
+        """
+        self._check_writable()
+        # Обход в ширину: fail-ссылка всегда ведёт в узел меньшей глубины,
+        # строка таблицы для которого к этому моменту уже заполнена
+        nodes, tables = self._trie_tables()
+        chars = set()
+        for node in nodes:
+            chars.update(node.children)
+
+        alphabet = {char: col for col, char in enumerate(sorted(chars), 1)}
+        k = len(alphabet) + 1
+        delta = array('i', [0]) * (len(nodes) * k)
+
+        for node in nodes:
+            base = node.node_id * k
+            if node is not self.root:
+                fail_base = node.fail.node_id * k
+                delta[base:base + k] = delta[fail_base:fail_base + k]
+            for char, child in node.children.items():
+                delta[base + alphabet[char]] = child.node_id
+
+        self._fold_alphabet(alphabet)
+        self.alphabet = alphabet
+        self.n_columns = k
+        self.delta = delta
+        for name, table in zip(_LinkTables._fields, tables):
+            setattr(self, name, table)
+        if self.observer is not None:
+            self.observer(TraceEvent('compiled', detail=(len(nodes), k)))
+
+    def _trie_tables(self):
+        """Узлы бора в порядке обхода в ширину и таблицы ссылок состояний
+
+        Номер состояния - node_id. Собственные выходы состояния s лежат в
+        out_*[out_start[s]:out_start[s + 1]], остальные находятся переходом
+        по выходным ссылкам out_link. Время и память линейны по числу
+        состояний и шаблонов.
+        """
+        nodes = []
+        queue = deque([self.root])
+        parent = array('i', [-1]) * (self.node_counter + 1)
+        edge = array('i', [-1]) * (self.node_counter + 1)
+        while queue:
+            node = queue.popleft()
+            if node is not self.root and node.fail is None:
+                raise RuntimeError("Сначала нужно вызвать build_fail_links()")
+            nodes.append(node)
+            for char, child in node.children.items():
+                parent[child.node_id] = node.node_id
+                edge[child.node_id] = ord(char)
+                queue.append(child)
+
+        out_start = array('i', [0])
+        out_patterns = array('i')
+        out_lengths = array('i')
+        out_first = array('i')
+        out_link = array('i')
+        fail = array('i')
+        for node in sorted(nodes, key=lambda n: n.node_id):
+            fail.append(node.fail.node_id if node.fail else 0)
+            for pattern_index, pattern_len in node.output:
+                out_patterns.append(pattern_index)
+                out_lengths.append(pattern_len)
+            out_start.append(len(out_patterns))
+            link = node.output_link.node_id if node.output_link else -1
+            out_link.append(link)
+            out_first.append(node.node_id if node.output else link)
+        return nodes, _LinkTables(fail, parent, edge, out_start, out_patterns,
+                                  out_lengths, out_first, out_link)
+
+    def _link_tables(self):
+        """Таблицы ссылок для statistics: из скомпилированного автомата, если
+        он актуален, иначе - одним обходом бора, без плотной таблицы"""
+        if self.delta is not None:
+            return _LinkTables(*(getattr(self, name) for name in _LinkTables._fields))
+        return self._trie_tables()[1]
+
+    def compile_bytes(self):
+        """Компиляция байтового ДКА для поиска в bytes / memoryview / mmap
+
+        Строится по таблицам compile() (вызывается при необходимости), так
+        что работает и для автомата, загруженного load(). Каждое ребро бора
+        разворачивается в цепочку рёбер по байтам UTF-8 представления его
+        символа; так как UTF-8 - префиксный код, состояния исходного бора
+        переходят в байтовый бор один к одному. Байтовые таблицы в файл
+        save() не пишутся. Для нормализованного автомата (case_insensitive,
+        ascii_folding) байтовый режим недоступен: варианты символа имеют
+        разную длину в UTF-8, и длина совпадения в байтах не определена.
+
+        Столбцы таблицы - классы эквивалентности байтов: все байты, не
+        встречающиеся в шаблонах, переходят одинаково и образуют класс 0,
+        каждый встречающийся байт получает свой класс (их столбцы заведомо
+        различны: только по нему можно попасть в его дочерние состояния).
+        Строка состояния занимает 4 * (число классов) байт вместо 4 * 256,
+        а вход переводится в классы блоками через bytes.translate.
+        """
+        if self.case_insensitive or self.ascii_folding:
+            raise ValueError("Байтовый поиск не поддерживается для нормализованного автомата")
+        if self.delta is None:
+            self.compile()
+        parent = self.parent
+        edge = self.edge
+        out_start = self.out_start
+        out_patterns = self.out_patterns
+        n = len(self.fail)
+
+        # Байтовый бор: ключ перехода - байтовое состояние << 8 | байт.
+        # Родитель состояния всегда имеет меньший номер, чем оно само
+        goto = {}
+        state_of = array('i', [0]) * n  # Байтовое состояние каждого состояния бора
+        depth = [0]                     # Глубина байтового состояния в байтах
+        for s in range(1, n):
+            state = state_of[parent[s]]
+            for byte in chr(edge[s]).encode('utf-8', 'surrogatepass'):
+                key = state << 8 | byte
+                next_state = goto.get(key)
+                if next_state is None:
+                    next_state = goto[key] = len(depth)
+                    depth.append(depth[state] + 1)
+                state = next_state
+            state_of[s] = state
+
+        byte_classes = bytearray(256)
+        used = sorted({key & 255 for key in goto})
+        for column, byte in enumerate(used, 1):
+            byte_classes[byte] = column
+        k = len(used) + 1
+
+        m = len(depth)
+        children = [[] for _ in range(m)]
+        for key, target in goto.items():
+            children[key >> 8].append((byte_classes[key & 255], target))
+
+        # Таблица переходов и fail-ссылки обходом в ширину, как в compile
+        delta = array('i', [0]) * (m * k)
+        fail = array('i', [0]) * m
+        order = []
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            base = state * k
+            if state:
+                fail_base = fail[state] * k
+                delta[base:base + k] = delta[fail_base:fail_base + k]
+            for column, child in children[state]:
+                fail[child] = delta[base + column]  # Переход из fail-узла (у корня - 0)
+                delta[base + column] = child
+                queue.append(child)
+
+        # Собственные выходы переносятся из состояний бора, длина - в байтах
+        owner = array('i', [-1]) * m
+        for s in range(n):
+            if out_start[s] < out_start[s + 1]:
+                owner[state_of[s]] = s
+        byte_out_start = array('i', [0])
+        byte_out_patterns = array('i')
+        byte_out_lengths = array('i')
+        for state in range(m):
+            s = owner[state]
+            if s >= 0:
+                for j in range(out_start[s], out_start[s + 1]):
+                    byte_out_patterns.append(out_patterns[j])
+                    byte_out_lengths.append(depth[state])
+            byte_out_start.append(len(byte_out_patterns))
+
+        byte_out_first = array('i', [-1]) * m
+        byte_out_link = array('i', [-1]) * m
+        for state in order:
+            link = byte_out_first[fail[state]] if state else -1
+            byte_out_link[state] = link
+            byte_out_first[state] = state if owner[state] >= 0 else link
+
+        self.byte_classes = bytes(byte_classes)
+        self.byte_n_columns = k
+        self.byte_delta = delta
+        self.byte_out_start = byte_out_start
+        self.byte_out_patterns = byte_out_patterns
+        self.byte_out_lengths = byte_out_lengths
+        self.byte_out_first = byte_out_first
+        self.byte_out_link = byte_out_link
+
+    def save(self, path):
+        """Сохранение скомпилированного автомата в файл для load()"""
+        if self.delta is None:
+            raise RuntimeError("Сначала нужно вызвать compile()")
+        with open(path, 'wb') as f:
+            self._write(f)
+
+    def _write(self, f):
+        """Запись заголовка, алфавита и таблиц в файловый объект"""
+        chars = sorted(self.alphabet)
+        encoded = ''.join(chars).encode('utf-8', 'surrogatepass')
+        flags = ((_CASE_INSENSITIVE if self.case_insensitive else 0)
+                 | (_ASCII_FOLDING if self.ascii_folding else 0))
+        f.write(_HEADER.pack(AUTOMATON_MAGIC, AUTOMATON_VERSION, _BYTE_ORDER_MARK,
+                             len(self.fail), self.n_columns, len(self.out_patterns),
+                             len(chars), len(encoded), flags))
+        f.write(encoded + b'\0' * (-len(encoded) % 4))
+        f.write(array('i', [self.alphabet[char] for char in chars]))
+        for name in _TABLES:
+            f.write(getattr(self, name))
+
+    def _dump(self):
+        """Автомат в формате save() в виде буфера в памяти"""
+        buffer = io.BytesIO()
+        self._write(buffer)
+        return buffer.getbuffer()
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка автомата, сохранённого save(), через отображение файла в память
+
+        Таблицы не копируются: атрибуты автомата - это memoryview поверх
+        mmap, поэтому процессы, загрузившие один файл, разделяют его
+        страницы, а загрузка занимает время, не зависящее от размера таблиц.
+        Загруженный автомат поддерживает только поиск.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls._from_buffer(memoryview(buffer))
+
+    @classmethod
+    def _from_buffer(cls, view):
+        """Создание автомата поверх буфера в формате save()"""
+        (magic, version, byte_order, n_states, n_columns, n_outputs,
+         n_chars, chars_size, flags) = _HEADER.unpack_from(view)
+        if magic != AUTOMATON_MAGIC or version != AUTOMATON_VERSION:
+            raise ValueError("Неизвестный формат файла автомата")
+        if byte_order != _BYTE_ORDER_MARK:
+            raise ValueError("Файл автомата сохранён на платформе с другим порядком байт")
+
+        offset = _HEADER.size
+        chars = str(view[offset:offset + chars_size], 'utf-8', 'surrogatepass')
+        offset += chars_size + (-chars_size % 4)
+        sizes = {
+            'delta': n_states * n_columns,
+            'fail': n_states,
+            'out_start': n_states + 1,
+            'out_patterns': n_outputs,
+            'out_lengths': n_outputs,
+            'out_first': n_states,
+            'out_link': n_states,
+            'parent': n_states,
+            'edge': n_states,
+        }
+        columns = view[offset:offset + 4 * n_chars].cast('i')
+        offset += 4 * n_chars
+
+        automaton = cls(case_insensitive=bool(flags & _CASE_INSENSITIVE),
+                        ascii_folding=bool(flags & _ASCII_FOLDING))
+        automaton.alphabet = dict(zip(chars, columns))
+        automaton.n_columns = n_columns
+        for name in _TABLES:
+            size = 4 * sizes[name]
+            setattr(automaton, name, view[offset:offset + size].cast('i'))
+            offset += size
+        automaton.node_counter = n_states - 1
+        automaton.read_only = True
+        return automaton
+
+    def _tables(self, text):
+        """Символы входа, функция столбца и таблицы автомата для text
+
+        Строка идёт по таблице символов (compile), двоичные данные - по
+        байтовой таблице (compile_bytes): они просматриваются через
+        memoryview как последовательность байт, позиции и длины - в байтах.
+        Возвращает (символы, столбец, delta, k, out_start, out_patterns,
+        out_lengths, out_first, out_link); столбец вызывается как
+        column(символ, 0).
+        """
+        if isinstance(text, _BYTES_TYPES):
+            if self.byte_delta is None:
+                self.compile_bytes()
+            return (memoryview(text).cast('B'), dict(enumerate(self.byte_classes)).get,
+                    self.byte_delta, self.byte_n_columns, self.byte_out_start,
+                    self.byte_out_patterns, self.byte_out_lengths, self.byte_out_first,
+                    self.byte_out_link)
+        if self.delta is None:
+            self.compile()
+        return (text, self.alphabet.get, self.delta, self.n_columns, self.out_start,
+                self.out_patterns, self.out_lengths, self.out_first, self.out_link)
+
+    def _search_compiled(self, text, report_from=0, offset=0):
+        """Поиск по скомпилированной таблице переходов
+
+        Первые report_from символов только прогоняют автомат (совпадения,
+        заканчивающиеся в них, не сообщаются), offset прибавляется к позициям.
+        Двоичные данные просматриваются по байтовой таблице (см. _tables).
+        """
+        (text, column, delta, k, out_start, out_patterns, out_lengths,
+         out_first, out_link) = self._tables(text)
+        state = 0
+        matches = []
+
+        for char in islice(text, report_from):
+            state = delta[state * k + column(char, 0)]
+        for i, char in enumerate(islice(text, report_from, None), report_from + offset):
+            state = delta[state * k + column(char, 0)]
+            report = out_first[state]
+            while report >= 0:
+                for j in range(out_start[report], out_start[report + 1]):
+                    matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+                report = out_link[report]
+        return matches
+
+    def _search_bytes(self, data):
+        """Поиск в двоичных данных по байтовой таблице (позиции - 1-based в байтах)
+
+        data - bytes, bytearray, mmap или memoryview с C-порядком элементов;
+        просматривается через memoryview без декодирования, в классы байтов
+        переводятся блоки по DEFAULT_CHUNK_SIZE, а не весь вход.
+        """
+        if self.byte_delta is None:
+            self.compile_bytes()
+        classes = self.byte_classes
+        k = self.byte_n_columns
+        delta = self.byte_delta
+        out_start = self.byte_out_start
+        out_patterns = self.byte_out_patterns
+        out_lengths = self.byte_out_lengths
+        out_first = self.byte_out_first
+        out_link = self.byte_out_link
+        state = 0
+        matches = []
+
+        with memoryview(data) as view, view.cast('B') as octets:
+            for start in range(0, len(octets), DEFAULT_CHUNK_SIZE):
+                block = octets[start:start + DEFAULT_CHUNK_SIZE].tobytes().translate(classes)
+                for i, column in enumerate(block, start):
+                    state = delta[state * k + column]
+                    report = out_first[state]
+                    while report >= 0:
+                        for j in range(out_start[report], out_start[report + 1]):
+                            matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+                        report = out_link[report]
+        return matches
+
+    def _search_compiled_traced(self, text):
+        """_search_compiled с передачей событий наблюдателю"""
+        trace = self.observer
+        trace(TraceEvent('search_start', detail=text))
+        state = 0
+        matches = []
+        for i, char in enumerate(text):
+            trace(TraceEvent('char', state, char, i + 1))
+            state = self.delta[state * self.n_columns + self.alphabet.get(char, 0)]
+            if state:
+                trace(TraceEvent('goto', state, char, i + 1))
+            else:
+                trace(TraceEvent('root', 0, char, i + 1))
+            report = self.out_first[state]
+            while report >= 0:
+                for j in range(self.out_start[report], self.out_start[report + 1]):
+                    start_pos = i - self.out_lengths[j] + 2
+                    trace(TraceEvent('match', report, char, start_pos, self.out_patterns[j]))
+                    matches.append((start_pos, self.out_patterns[j]))
+                report = self.out_link[report]
+        trace(TraceEvent('search_done'))
+        return matches
+
+    def search_parallel(self, text, processes=None, min_segment=1 << 20):
+        """Параллельный поиск по большому тексту в пуле процессов
+
+        Текст делится на сегменты, каждый из которых захватывает
+        (длина самого длинного шаблона - 1) символов предыдущего: так любое
+        вхождение целиком лежит в сегменте, где оно заканчивается. Совпадения,
+        заканчивающиеся в перекрытии, сегмент не сообщает, поэтому дублей нет,
+        а склейка результатов по порядку сегментов даёт тот же порядок, что
+        и search(). Таблицы передаются процессам один раз через общую память
+        в формате save(), а не копируются в каждую задачу. Двоичные данные
+        делятся на сегменты по байтам, и исполнители просматривают их
+        байтовой таблицей (строят её по загруженным таблицам сами).
+        """
+        if isinstance(text, _BYTES_TYPES):
+            if self.byte_delta is None:
+                self.compile_bytes()
+            text = memoryview(text).cast('B')
+            out_lengths = self.byte_out_lengths
+        else:
+            if self.delta is None:
+                self.compile()
+            out_lengths = self.out_lengths
+        processes = processes or os.cpu_count() or 1
+        segments = min(processes, -(-len(text) // min_segment))
+        if segments <= 1:
+            return self._search_compiled(text)
+
+        overlap = max(out_lengths, default=1) - 1
+        size = -(-len(text) // segments)
+        tasks = []
+        for start in range(0, len(text), size):
+            begin = max(0, start - overlap)
+            segment = text[begin:start + size]
+            if isinstance(segment, memoryview):
+                segment = segment.tobytes()  # memoryview не передаётся в процесс
+            tasks.append((segment, start - begin, begin))
+
+        data = self._dump()
+        memory = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            memory.buf[:len(data)] = data
+            with ProcessPoolExecutor(segments, initializer=_init_search_worker,
+                                     initargs=(memory.name, type(self))) as pool:
+                matches = []
+                for part in pool.map(_search_segment, tasks):
+                    matches.extend(part)
+        finally:
+            memory.close()
+            memory.unlink()
+        return matches
+
+    def search_stream(self, source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        """Потоковый поиск: генератор совпадений (позиция, номер шаблона)
+
+        Текст читается блоками из source (см. _iter_chunks), состояние
+        автомата переносится между блоками, поэтому совпадения на границе
+        блоков не теряются, а позиции (1-based) отсчитываются от начала
+        всего потока. Память не зависит от длины текста. При encoding=None
+        двоичный поток не декодируется, а просматривается байтовым
+        автоматом (см. compile_bytes), позиции - в байтах.
+        """
+        if encoding is None:
+            if self.byte_delta is None:
+                self.compile_bytes()
+        elif self.delta is None:
+            self.compile()
+        state = 0
+        offset = 0
+        for chunk in _iter_chunks(source, chunk_size, encoding):
+            matches, state = self.scan_chunk(chunk, state, offset)
+            offset += len(chunk)
+            yield from matches
+
+    def scan_chunk(self, chunk, state=0, offset=0):
+        """Прогон одного блока из состояния state: (совпадения, новое состояние)
+
+        Блок str идёт по таблице символов, двоичный - по байтовой таблице
+        (см. compile_bytes). offset - число символов (байт) до начала блока,
+        позиции совпадений (1-based) отсчитываются от начала потока. На нём
+        построены search_stream и search_async. Кроме ленивой компиляции
+        таблиц метод не меняет автомат, поэтому после неё его можно
+        вызывать из другого потока.
+        """
+        matches = []
+        if isinstance(chunk, str):
+            if self.delta is None:
+                self.compile()
+            delta = self.delta
+            k = self.n_columns
+            column = self.alphabet.get
+            out_start = self.out_start
+            out_patterns = self.out_patterns
+            out_lengths = self.out_lengths
+            out_first = self.out_first
+            out_link = self.out_link
+            for i, char in enumerate(chunk, offset):
+                state = delta[state * k + column(char, 0)]
+                report = out_first[state]
+                while report >= 0:
+                    for j in range(out_start[report], out_start[report + 1]):
+                        matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+                    report = out_link[report]
+            return matches, state
+
+        if self.byte_delta is None:
+            self.compile_bytes()
+        k = self.byte_n_columns
+        delta = self.byte_delta
+        out_start = self.byte_out_start
+        out_patterns = self.byte_out_patterns
+        out_lengths = self.byte_out_lengths
+        out_first = self.byte_out_first
+        out_link = self.byte_out_link
+        with memoryview(chunk) as view, view.cast('B') as octets:
+            block = octets.tobytes().translate(self.byte_classes)
+        for i, column in enumerate(block, offset):
+            state = delta[state * k + column]
+            report = out_first[state]
+            while report >= 0:
+                for j in range(out_start[report], out_start[report + 1]):
+                    matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+                report = out_link[report]
+        return matches, state
+
+    async def search_async(self, source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8',
+                           executor=None, offload_size=OFFLOAD_SIZE):
+        """Асинхронный потоковый поиск: асинхронный генератор совпадений
+
+        source - asyncio.StreamReader (или любой объект с корутиной
+        read(n)) либо асинхронный итерируемый объект из блоков str/bytes.
+        Двоичные блоки декодируются инкрементально, как в search_stream;
+        при encoding=None они просматриваются байтовым автоматом, а
+        позиции отсчитываются в байтах. Состояние автомата переносится
+        между блоками, позиции (1-based) - от начала потока.
+
+        Следующий блок читается только после того, как потребитель забрал
+        все совпадения предыдущего, поэтому медленный потребитель
+        притормаживает чтение (StreamReader, заполнив буфер, приостанавливает
+        транспорт). Блоки от offload_size символов (байт) просматриваются
+        через scan_chunk в executor (по умолчанию - пул потоков цикла
+        событий), чтобы цикл событий не блокировался на время прогона.
+        """
+        if encoding is None:
+            if self.byte_delta is None:
+                self.compile_bytes()
+        elif self.delta is None:
+            self.compile()
+        loop = asyncio.get_running_loop()
+        decoder = None
+        state = 0
+        offset = 0
+        async for chunk in _aiter_chunks(source, chunk_size):
+            if encoding is not None and not isinstance(chunk, str):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(encoding)()
+                chunk = decoder.decode(chunk)
+            if len(chunk) >= offload_size:
+                matches, state = await loop.run_in_executor(
+                    executor, self.scan_chunk, chunk, state, offset)
+            else:
+                matches, state = self.scan_chunk(chunk, state, offset)
+            offset += len(chunk)
+            for match in matches:
+                yield match
+        if decoder is not None:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                matches, state = self.scan_chunk(tail, state, offset)
+                for match in matches:
+                    yield match
+
+    def iter_search(self, text):
+        """Ленивый поиск: совпадения в порядке search(), но по одному
+
+        Двоичные данные просматриваются байтовым автоматом блоками по
+        DEFAULT_CHUNK_SIZE, позиции - в байтах, как у search().
+        """
+        if isinstance(text, _BYTES_TYPES):
+            return self.search_stream(text, encoding=None)
+        return self.search_stream(text)
+
+    def count_matches(self, text):
+        """Число вхождений каждого шаблона: {номер шаблона: количество}
+
+        Во время прохода по тексту считается только число посещений каждого
+        состояния; вклад посещений в шаблоны цепочек выходных ссылок
+        раскладывается один раз в конце, независимо от длины текста.
+        Двоичные данные просматриваются по байтовой таблице (см. _tables).
+        """
+        (text, column, delta, k, out_start, out_patterns, _,
+         out_first, out_link) = self._tables(text)
+        visits = array('q', [0]) * len(out_first)
+        state = 0
+        for char in text:
+            state = delta[state * k + column(char, 0)]
+            visits[state] += 1
+
+        counts = {}
+        for state, times in enumerate(visits):
+            if not times:
+                continue
+            report = out_first[state]
+            while report >= 0:
+                for j in range(out_start[report], out_start[report + 1]):
+                    pattern_index = out_patterns[j]
+                    counts[pattern_index] = counts.get(pattern_index, 0) + times
+                report = out_link[report]
+        return counts
+
+    def contains_any(self, text):
+        """Есть ли в тексте хотя бы одно вхождение (до первого совпадения)"""
+        text, column, delta, k, _, _, _, out_first, _ = self._tables(text)
+        state = 0
+        for char in text:
+            state = delta[state * k + column(char, 0)]
+            if out_first[state] >= 0:
+                return True
+        return False
+
+    def first_match(self, text):
+        """Первое совпадение в порядке search() или None"""
+        (text, column, delta, k, out_start, out_patterns, out_lengths,
+         out_first, _) = self._tables(text)
+        state = 0
+        for i, char in enumerate(text):
+            state = delta[state * k + column(char, 0)]
+            report = out_first[state]
+            if report >= 0:
+                j = out_start[report]
+                return (i - out_lengths[j] + 2, out_patterns[j])
+        return None
+
+    def search_longest(self, text):
+        """Непересекающиеся совпадения: самое левое, из них самое длинное
+
+        Кандидат фиксируется, как только ни одно будущее совпадение (длиной
+        не больше самого длинного шаблона) не может начаться левее него;
+        после этого поиск продолжается с корня сразу за его концом.
+        Двоичные данные просматриваются по байтовой таблице (см. _tables).
+        """
+        (text, column, delta, k, out_start, out_patterns, out_lengths,
+         out_first, out_link) = self._tables(text)
+        longest = max(out_lengths, default=0)
+        matches = []
+        best_start = best_end = best_index = -1
+        state = 0
+        i = 0
+        n = len(text)
+
+        while True:
+            if i < n:
+                state = delta[state * k + column(text[i], 0)]
+                report = out_first[state]
+                while report >= 0:
+                    for j in range(out_start[report], out_start[report + 1]):
+                        start = i - out_lengths[j] + 1
+                        if best_start < 0 or start < best_start or (start == best_start and i > best_end):
+                            best_start, best_end, best_index = start, i, out_patterns[j]
+                    report = out_link[report]
+                i += 1
+                if best_start < 0 or i - longest + 1 <= best_start:
+                    continue
+            elif best_start < 0:
+                break
+            # Фиксируем кандидата и продолжаем с корня сразу за ним
+            matches.append((best_start + 1, best_index))
+            i = best_end + 1
+            state = 0
+            best_start = -1
+        return matches
 
     def search(self, text):
-        """Поиск всех вхождений шаблонов в тексте"""
-        print(f"Начинаем поиск в тексте: '{text}'")
-        node = self.root
+        """Поиск всех вхождений шаблонов в тексте
+
+        text - строка либо двоичные данные (bytes, bytearray, memoryview,
+        mmap); двоичные данные просматриваются байтовым автоматом без
+        копирования, а позиции совпадений отсчитываются в байтах.
+        """
+        if isinstance(text, _BYTES_TYPES):
+            return self._search_bytes(text)
+        if self.delta is None and (self.case_insensitive or self.ascii_folding):
+            self.compile()
+        if self.delta is not None:
+            if self.observer is not None:
+                return self._search_compiled_traced(text)
+            return self._search_compiled(text)
+        if self.observer is not None:
+            return self._search_traced(text)
+        return self._search_nodes(text)
+
+    def _search_nodes(self, text):
+        """Поиск по бору с переходами по fail-ссылкам"""
+        root = self.root
+        node = root
         matches = []
 
         for i, char in enumerate(text):
-            print(f"\nОбрабатываем символ '{char}' (позиция {i+1})")
             # Если нет перехода по символу - идём по fail-ссылкам
+            while node is not root and char not in node.children:
+                node = node.fail
+            node = node.children.get(char, root)
+
+            # Шаблоны текущего узла и узлов его цепочки выходных ссылок
+            out_node = node if node.output else node.output_link
+            while out_node is not None:
+                for pattern_index, pattern_len in out_node.output:
+                    matches.append((i - pattern_len + 2, pattern_index))  # 1-based позиция старта
+                out_node = out_node.output_link
+        return matches
+
+    def _search_traced(self, text):
+        """_search_nodes с передачей событий наблюдателю"""
+        trace = self.observer
+        trace(TraceEvent('search_start', detail=text))
+        node = self.root
+        matches = []
+
+        for i, char in enumerate(text):
+            trace(TraceEvent('char', node.node_id, char, i + 1))
             while node != self.root and char not in node.children:
-                print(f"  Нет перехода по '{char}', следуем по fail-ссылке")
+                trace(TraceEvent('fail', node.node_id, char, i + 1))
                 node = node.fail
 
             if char in node.children:
                 node = node.children[char]
-                print(f"  Переход по символу '{char}' успешен в узел с ID {node.node_id}")
+                trace(TraceEvent('goto', node.node_id, char, i + 1))
             else:
                 node = self.root
-                print(f"  Переход по символу '{char}' не найден, возвращаемся в корень")
+                trace(TraceEvent('root', 0, char, i + 1))
 
-            # Если есть выходы (output), значит нашли шаблоны
-            for pattern_index, pattern_len in node.output:
-                start_pos = i - pattern_len + 2  # Позиция старта в 1-based индексации
-                print(f"  Найдено совпадение: шаблон {pattern_index} на позиции {start_pos}")
-                matches.append((start_pos, pattern_index))
+            out_node = node if node.output else node.output_link
+            while out_node is not None:
+                for pattern_index, pattern_len in out_node.output:
+                    start_pos = i - pattern_len + 2
+                    trace(TraceEvent('match', out_node.node_id, char, start_pos, pattern_index))
+                    matches.append((start_pos, pattern_index))
+                out_node = out_node.output_link
 
-        print("\nПоиск завершён.\n")
+        trace(TraceEvent('search_done'))
         return matches
 
-    def compute_chain_lengths(self):
-        """Вычисление максимальных длин цепочек суффиксных и конечных ссылок"""
-        print("\n" + "="*50)
-        print("Подробный анализ длин цепочек ссылок...")
-        print("="*50 + "\n")
+    def statistics(self):
+        """Статистика автомата за один проход в ширину, без печати
 
-        nodes = []
-        def collect_nodes(node):
-            nodes.append(node)
-            for child in node.children.values():
-                collect_nodes(child)
-        collect_nodes(self.root)
+        Длины цепочек считаются динамикой по уже обработанным состояниям:
+        длина fail-цепочки состояния на 1 больше, чем у его fail-узла, а
+        длина цепочки выходных ссылок - как у fail-узла плюс 1, если в
+        состоянии заканчивается шаблон. Возвращает словарь:
 
-        # Вычисляем максимальную длину цепочки по fail-ссылкам
-        max_fail_length = 0
-        fail_chains = []
+            states, patterns, accepting_states, leaves, max_depth,
+            max_fail_chain, max_output_chain - числа;
+            fail_chain_end, output_chain_end - состояния, где начинаются
+                самые длинные цепочки (или -1);
+            depth_histogram - список: глубина -> число состояний;
+            fanout_distribution - словарь: число детей -> число состояний.
 
-        for node in nodes:
-            if node == self.root:
+        Автомат не компилируется: без таблицы переходов ссылки берутся
+        из бора (см. _link_tables).
+        """
+        tables = self._link_tables()
+        fail = tables.fail
+        parent = tables.parent
+        out_start = tables.out_start
+        n = len(fail)
+
+        # Родитель создаётся раньше ребёнка, поэтому глубины и число детей
+        # считаются одним проходом по номерам состояний
+        depth = array('i', [0]) * n
+        fanout = array('i', [0]) * n
+        for s in range(1, n):
+            depth[s] = depth[parent[s]] + 1
+            fanout[parent[s]] += 1
+        max_depth = max(depth, default=0)
+        depth_histogram = [0] * (max_depth + 1)
+        for d in depth:
+            depth_histogram[d] += 1
+
+        # Порядок обхода в ширину - сортировка подсчётом по глубине
+        starts = [0] * (max_depth + 2)
+        for d in range(max_depth + 1):
+            starts[d + 1] = starts[d] + depth_histogram[d]
+        order = array('i', [0]) * n
+        for s in range(n):
+            order[starts[depth[s]]] = s
+            starts[depth[s]] += 1
+
+        fail_chain = array('i', [0]) * n
+        output_chain = array('i', [0]) * n
+        fail_chain_end = output_chain_end = -1
+        for s in order:
+            if not s:
                 continue
-            length = 0
-            current = node
-            chain_nodes = [current]
-            while current != self.root and current.fail:
-                length += 1
-                current = current.fail
-                chain_nodes.append(current)
-
-            if length > 0:
-                # Получаем символы для идентификации узлов
-                chain_info = []
-                for n in chain_nodes[:-1]:  # Исключаем корень из вывода
-                    # Находим символ(ы) перехода к этому узлу
-                    chars = []
-                    for parent in nodes:
-                        for char, child in parent.children.items():
-                            if child == n:
-                                chars.append(char)
-                    if chars:
-                        chain_info.append(f"'{''.join(chars)}' (ID {n.node_id})")
-                    else:
-                        chain_info.append("(root)")
+            f = fail[s]
+            fail_chain[s] = fail_chain[f] + 1
+            output_chain[s] = output_chain[f] + (out_start[s] != out_start[s + 1])
+            if fail_chain_end < 0 or fail_chain[s] > fail_chain[fail_chain_end]:
+                fail_chain_end = s
+            if output_chain[s] and (output_chain_end < 0 or output_chain[s] > output_chain[output_chain_end]):
+                output_chain_end = s
 
-                fail_chains.append((length, chain_info))
-                max_fail_length = max(max_fail_length, length)
+        fanout_distribution = {}
+        for count in fanout:
+            fanout_distribution[count] = fanout_distribution.get(count, 0) + 1
+        return {
+            'states': n,
+            'patterns': len(tables.out_patterns),
+            'accepting_states': sum(out_start[s] != out_start[s + 1] for s in range(n)),
+            'leaves': fanout_distribution.get(0, 0),
+            'max_depth': max_depth,
+            'max_fail_chain': fail_chain[fail_chain_end] if fail_chain_end >= 0 else 0,
+            'max_output_chain': output_chain[output_chain_end] if output_chain_end >= 0 else 0,
+            'fail_chain_end': fail_chain_end,
+            'output_chain_end': output_chain_end,
+            'depth_histogram': depth_histogram,
+            'fanout_distribution': fanout_distribution,
+        }
 
-        # Сортируем цепочки по длине для наглядности
-        fail_chains.sort(reverse=True, key=lambda x: x[0])
+    def state_label(self, state, tables=None):
+        """Строка, по которой из корня бора приходим в состояние
 
-        print("\nЦепочки суффиксных (fail) ссылок:")
-        if not fail_chains:
-            print("  Нет цепочек длиннее 1")
-        else:
-            for length, chain in fail_chains:
-                print(f"  Длина {length}: {' -> '.join(chain)}")
+        tables - таблицы ссылок (_link_tables), если они уже построены.
+        """
+        tables = tables or self._link_tables()
+        chars = []
+        while state > 0:
+            chars.append(chr(tables.edge[state]))
+            state = tables.parent[state]
+        return ''.join(reversed(chars))
 
-        # Вычисляем максимальную длину цепочки по выходным ссылкам
-        max_output_length = 0
-        output_chains = []
+    def compute_chain_lengths(self):
+        """Вывод максимальных длин цепочек суффиксных и конечных ссылок"""
+        stats = self.statistics()
+        tables = self._link_tables()
+        print("\n" + "="*50)
+        print("Анализ длин цепочек ссылок...")
+        print("="*50 + "\n")
+        print(f"Состояний: {stats['states']}, шаблонов: {stats['patterns']}, "
+              f"максимальная глубина: {stats['max_depth']}")
 
-        for node in nodes:
-            if node.output:
-                length = 1  # сам узел считается
-                current = node.fail
-                chain_nodes = [node]
-                while current != self.root:
-                    if current.output:
-                        length += 1
-                        chain_nodes.append(current)
-                    current = current.fail
-
-                if length > 1:
-                    # Получаем информацию о шаблонах в цепочке
-                    patterns_info = []
-                    for n in chain_nodes:
-                        patterns = [f"'{pat[0]}' (длина {pat[1]})" for pat in n.output]
-                        patterns_info.append(f"[{', '.join(patterns)}]")
-
-                    output_chains.append((length, patterns_info))
-                    max_output_length = max(max_output_length, length)
-
-        # Сортируем цепочки по длине
-        output_chains.sort(reverse=True, key=lambda x: x[0])
-
-        print("\nЦепочки выходных (output) ссылок:")
-        if not output_chains:
-            print("  Нет цепочек длиннее 1")
-        else:
-            for length, chain in output_chains:
-                print(f"  Длина {length}: {' -> '.join(chain)}")
+        print("\nСамая длинная цепочка суффиксных (fail) ссылок:")
+        chain = []
+        state = stats['fail_chain_end']
+        while state > 0:
+            chain.append(f"'{self.state_label(state, tables)}' (ID {state})")
+            state = tables.fail[state]
+        print(f"  {' -> '.join(chain)}" if chain else "  Нет цепочек")
+
+        print("\nСамая длинная цепочка выходных (output) ссылок:")
+        chain = []
+        state = stats['output_chain_end']
+        state = tables.out_first[state] if state >= 0 else -1
+        while state >= 0:
+            patterns = [str(tables.out_patterns[j])
+                        for j in range(tables.out_start[state], tables.out_start[state + 1])]
+            chain.append(f"'{self.state_label(state, tables)}' [шаблоны {', '.join(patterns)}]")
+            state = tables.out_link[state]
+        print(f"  {' -> '.join(chain)}" if chain else "  Нет цепочек")
 
         print("\n" + "="*50)
         print("Итоговые максимальные длины цепочек:")
-        print(f"Максимальная длина цепочки суффиксных (fail) ссылок: {max_fail_length}")
-        print(f"Максимальная длина цепочки выходных (output) ссылок: {max_output_length}")
+        print(f"Максимальная длина цепочки суффиксных (fail) ссылок: {stats['max_fail_chain']}")
+        print(f"Максимальная длина цепочки выходных (output) ссылок: {stats['max_output_chain']}")
         print("="*50 + "\n")
 
-def main():
-    """Основная функция"""
+class CompactAhoKorasik(AhoKorasik):
+    """Автомат Ахо-Корасик на плоских массивах вместо объектов Node
+
+    Тот же интерфейс add_pattern / build_fail_links / compile / search, но
+    состояния - это целые числа. Во время добавления шаблонов переходы
+    хранятся в одном словаре (ключ: состояние << 21 | код символа), а в
+    build_fail_links бор перенумеровывается в порядке обхода в ширину, так
+    что дети каждого состояния получают подряд идущие номера, и
+    упаковывается в массивы array('i'):
+
+        child_start[s]..child_start[s + 1] - дети состояния s (по возрастанию
+                                        символа входящего ребра),
+        parent / edge                 - родитель и код символа входящего ребра,
+        fail, out_first, out_link     - ссылки состояния,
+        out_start / out_patterns / out_lengths - собственные выходы.
+
+    После build_fail_links на состояние приходится 28 байт (7 массивов по
+    одному int32 на состояние) и 8 байт на шаблон; у бора на Node со
+    словарями - порядка 300-400 байт на состояние. compile() добавляет
+    плотную таблицу ещё на 4 * n_columns байт на состояние.
+    """
+    def __init__(self, observer=None, case_insensitive=False, ascii_folding=False):
+        """Инициализация пустого автомата: состояние 0 - корень
+
+        Наблюдатель получает только события поиска по скомпилированной
+        таблице; построение CSR-массивов не трассируется. Опции
+        нормализации - как у AhoKorasik.
+        """
+        super().__init__(observer, case_insensitive, ascii_folding)
+        self.root = None
+        self._goto = {}                  # Переходы бора до упаковки в CSR
+        self._end_states = array('i')    # Конечное состояние каждого шаблона
+        self._end_patterns = array('i')  # Номер каждого шаблона
+        self._end_lengths = array('i')   # Длина каждого шаблона
+        self.child_start = None
+
+    def add_pattern(self, pattern, index):
+        """Добавление одного шаблона в бор"""
+        self._check_writable()
+        if self._goto is None:
+            raise RuntimeError("Автомат уже построен, добавление шаблонов невозможно")
+        goto = self._goto
+        pattern = self.normalize(pattern)
+        state = 0
+        for char in pattern:
+            key = state << 21 | ord(char)
+            next_state = goto.get(key)
+            if next_state is None:
+                self.node_counter += 1
+                next_state = goto[key] = self.node_counter
+            state = next_state
+        self._end_states.append(state)
+        self._end_patterns.append(index)
+        self._end_lengths.append(len(pattern))
+
+    def build_fail_links(self):
+        """Упаковка бора в CSR-массивы и построение суффиксных и выходных ссылок"""
+        self._check_writable()
+        n = self.node_counter + 1
+
+        # Рёбра, упорядоченные по (родитель, символ), в старой нумерации
+        keys = sorted(self._goto)
+        old_start = array('i', [0]) * (n + 1)
+        for key in keys:
+            old_start[(key >> 21) + 1] += 1
+        for s in range(n):
+            old_start[s + 1] += old_start[s]
+        old_targets = array('i', [self._goto[key] for key in keys])
+        self._goto = None
+
+        # Перенумерация в порядке обхода в ширину: дети состояния получают
+        # подряд идущие номера, а fail-ссылка всегда ведёт к меньшему номеру
+        new_id = array('i', [0]) * n
+        order = array('i', [0])
+        child_start = array('i')
+        parent = array('i', [-1])
+        edge = array('i', [-1])
+        for state, old in enumerate(order):
+            child_start.append(len(order))
+            for e in range(old_start[old], old_start[old + 1]):
+                child = old_targets[e]
+                new_id[child] = len(order)
+                parent.append(state)
+                edge.append(keys[e] & 0x1FFFFF)
+                order.append(child)
+        child_start.append(n)
+        del keys, old_start, old_targets, order
+
+        fail = array('i', [0]) * n
+        for s in range(n):
+            for child in range(child_start[s], child_start[s + 1]):
+                char = edge[child]
+                f = s
+                while f:
+                    f = fail[f]
+                    lo, hi = child_start[f], child_start[f + 1]
+                    j = bisect_left(edge, char, lo, hi)
+                    if j < hi and edge[j] == char:
+                        fail[child] = j
+                        break
+
+        # Собственные выходы состояний (порядок добавления шаблонов сохраняется)
+        ends = sorted(range(len(self._end_states)), key=lambda i: new_id[self._end_states[i]])
+        out_start = array('i', [0]) * (n + 1)
+        for i in ends:
+            out_start[new_id[self._end_states[i]] + 1] += 1
+        for s in range(n):
+            out_start[s + 1] += out_start[s]
+        out_patterns = array('i', [self._end_patterns[i] for i in ends])
+        out_lengths = array('i', [self._end_lengths[i] for i in ends])
+        self._end_states = self._end_patterns = self._end_lengths = None
+
+        out_link = array('i', [-1]) * n
+        out_first = array('i', [-1]) * n
+        for s in range(n):
+            if s:
+                f = fail[s]
+                out_link[s] = f if out_start[f] != out_start[f + 1] else out_link[f]
+            out_first[s] = s if out_start[s] != out_start[s + 1] else out_link[s]
+
+        self.fail = fail
+        self.parent = parent
+        self.edge = edge
+        self.child_start = child_start
+        self.out_start = out_start
+        self.out_patterns = out_patterns
+        self.out_lengths = out_lengths
+        self.out_first = out_first
+        self.out_link = out_link
+
+    def _link_tables(self):
+        """Таблицы ссылок строит build_fail_links, таблица переходов не нужна"""
+        if self.fail is None:
+            raise RuntimeError("Сначала нужно вызвать build_fail_links()")
+        return _LinkTables(*(getattr(self, name) for name in _LinkTables._fields))
+
+    def compile(self):
+        """Построение плотной таблицы переходов из CSR-массивов"""
+        self._check_writable()
+        if self.fail is None:
+            raise RuntimeError("Сначала нужно вызвать build_fail_links()")
+        child_start = self.child_start
+        edge = self.edge
+        fail = self.fail
+        n = len(fail)
+
+        chars = set(edge[1:])
+        alphabet = {chr(c): col for col, c in enumerate(sorted(chars), 1)}
+        k = len(alphabet) + 1
+        columns = [alphabet.get(chr(c), 0) for c in range(max(chars, default=0) + 1)]
+        delta = array('i', [0]) * (n * k)
+        for s in range(n):
+            base = s * k
+            if s:
+                fail_base = fail[s] * k
+                delta[base:base + k] = delta[fail_base:fail_base + k]
+            for child in range(child_start[s], child_start[s + 1]):
+                delta[base + columns[edge[child]]] = child
+
+        self._fold_alphabet(alphabet)
+        self.alphabet = alphabet
+        self.n_columns = k
+        self.delta = delta
+
+    def search(self, text):
+        """Поиск всех вхождений шаблонов в тексте (1-based позиции)"""
+        if (self.delta is not None or isinstance(text, _BYTES_TYPES)
+                or self.case_insensitive or self.ascii_folding):
+            return super().search(text)
+        if self.fail is None:
+            raise RuntimeError("Сначала нужно вызвать build_fail_links()")
+        child_start = self.child_start
+        edge = self.edge
+        fail = self.fail
+        out_start = self.out_start
+        out_patterns = self.out_patterns
+        out_lengths = self.out_lengths
+        out_first = self.out_first
+        out_link = self.out_link
+        state = 0
+        matches = []
+
+        for i, char in enumerate(text):
+            code = ord(char)
+            while True:
+                lo, hi = child_start[state], child_start[state + 1]
+                j = bisect_left(edge, code, lo, hi)
+                if j < hi and edge[j] == code:
+                    state = j
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            report = out_first[state]
+            while report >= 0:
+                for j in range(out_start[report], out_start[report + 1]):
+                    matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+                report = out_link[report]
+        return matches
+
+# Согласованное состояние DynamicAhoKorasik: неизменяемые автоматы с номерами
+# их удалённых шаблонов и автомат последних добавленных шаблонов
+_Snapshot = namedtuple('_Snapshot', 'parts delta')
+
+class _FrozenPart:
+    """Автомат DynamicAhoKorasik, который после построения не меняется
+
+    patterns - словарь {номер: шаблон}, из которого построен автомат,
+    removed - номера его шаблонов, удалённых или заменённых позже: кортеж
+    неизменяемых множеств по убыванию размера. Новое удаление добавляет
+    множество из одного номера, и множества не больше нового сливаются,
+    как разряды двоичного счётчика, поэтому удаление копирует в среднем
+    O(log) номеров, а не все удалённые, и снимок остаётся неизменяемым.
+    """
+    __slots__ = ('patterns', 'automaton', 'removed')
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.automaton = DynamicAhoKorasik._build(patterns)
+        self.removed = ()
+
+    def is_removed(self, index):
+        """Удалён ли шаблон с номером index"""
+        return any(index in layer for layer in self.removed)
+
+    def remove(self, index):
+        """Отметка шаблона удалённым"""
+        layers = list(self.removed)
+        layer = frozenset((index,))
+        while layers and len(layers[-1]) <= len(layer):
+            layer = layers.pop() | layer
+        layers.append(layer)
+        self.removed = tuple(layers)
+
+    def removed_count(self):
+        """Число удалённых шаблонов автомата"""
+        return sum(map(len, self.removed))
+
+    def live(self):
+        """Актуальные шаблоны автомата"""
+        return {index: pattern for index, pattern in self.patterns.items()
+                if not self.is_removed(index)}
+
+class DynamicAhoKorasik:
+    """Словарь шаблонов, который можно менять, не перестраивая весь автомат
+
+    Шаблоны живут в нескольких автоматах CompactAhoKorasik: большом
+    основном, нескольких запечатанных и маленьком дополнительном (не больше
+    delta_limit шаблонов). add_pattern перестраивает только дополнительный
+    автомат; заполнившись, он запечатывается, и запечатанные автоматы
+    сливаются попарно, как разряды двоичного счётчика, так что на каждый
+    добавленный шаблон приходится O(log) перестроений, а автоматов остаётся
+    O(log). Удаление шаблона из основного или запечатанного автомата не
+    перестраивает ничего: номер только добавляется к отфильтровываемым.
+    Когда запечатанных и удалённых шаблонов набирается больше merge_ratio
+    от размера основного автомата, все шаблоны сливаются в новый основной
+    автомат в фоновом потоке.
+
+    Состояние публикуется одним присваиванием неизменяемого снимка, поэтому
+    поиск, идущий параллельно с изменениями, видит согласованный словарь.
+    """
+    def __init__(self, patterns=(), merge_ratio=0.1, delta_limit=256):
+        """patterns - пары (шаблон, номер) начального словаря"""
+        self.merge_ratio = merge_ratio
+        self.delta_limit = delta_limit
+        self._lock = threading.Lock()
+        self._patterns = {index: pattern for pattern, index in patterns}  # Все актуальные
+        self._main = _FrozenPart(dict(self._patterns))
+        self._sealed = []          # Запечатанные автоматы по убыванию размера
+        self._delta_patterns = {}  # Содержимое дополнительного автомата
+        self._delta = None
+        self._merge_thread = None
+        self._publish(False)
+
+    @staticmethod
+    def _build(patterns):
+        """Скомпилированный автомат для словаря {номер: шаблон} или None"""
+        if not patterns:
+            return None
+        automaton = CompactAhoKorasik()
+        for index, pattern in patterns.items():
+            automaton.add_pattern(pattern, index)
+        automaton.build_fail_links()
+        automaton.compile()
+        return automaton
+
+    @property
+    def patterns(self):
+        """Копия актуального словаря {номер: шаблон}"""
+        with self._lock:
+            return dict(self._patterns)
+
+    def add_pattern(self, pattern, index):
+        """Добавление (или замена) шаблона с номером index"""
+        with self._lock:
+            if index in self._patterns:
+                self._discard(index)
+            self._patterns[index] = pattern
+            self._delta_patterns[index] = pattern
+            self._publish(True)
+
+    def remove_pattern(self, index):
+        """Удаление шаблона с номером index (KeyError, если его нет)"""
+        with self._lock:
+            if index not in self._patterns:
+                raise KeyError(index)
+            delta_changed = self._discard(index)
+            del self._patterns[index]
+            self._publish(delta_changed)
+
+    def _discard(self, index):
+        """Исключение шаблона; True, если он был в дополнительном автомате"""
+        if index in self._delta_patterns:
+            del self._delta_patterns[index]
+            return True
+        for part in (self._main, *self._sealed):
+            if index in part.patterns and not part.is_removed(index):
+                part.remove(index)
+                return False
+        return False
+
+    def _seal(self, patterns):
+        """Запечатывание шаблонов дополнительного автомата
+
+        Пока последний запечатанный автомат не больше нового, они
+        сливаются в один (удалённые шаблоны при этом отбрасываются).
+        """
+        part = _FrozenPart(patterns)
+        while self._sealed and len(self._sealed[-1].patterns) <= len(part.patterns):
+            part = _FrozenPart({**self._sealed.pop().live(), **part.live()})
+        self._sealed.append(part)
+
+    def _publish(self, delta_changed):
+        """Перестройка дополнительного автомата (если он менялся) и публикация снимка"""
+        if delta_changed:
+            if len(self._delta_patterns) >= self.delta_limit:
+                self._seal(self._delta_patterns)
+                self._delta_patterns = {}
+            self._delta = self._build(self._delta_patterns)
+        parts = tuple((part.automaton, part.removed) for part in (self._main, *self._sealed)
+                      if part.automaton is not None)
+        self._snapshot = _Snapshot(parts, self._delta)
+
+        pending = self._main.removed_count() + sum(len(part.patterns) for part in self._sealed)
+        if (pending > max(self.delta_limit, self.merge_ratio * len(self._main.patterns))
+                and self._merge_thread is None):
+            self._merge_thread = threading.Thread(target=self.merge, daemon=True)
+            self._merge_thread.start()
+
+    def merge(self):
+        """Слияние всех шаблонов в новый основной автомат
+
+        Автомат строится вне блокировки; изменения, сделанные за время
+        построения, переносятся в дополнительный автомат.
+        """
+        with self._lock:
+            merged = dict(self._patterns)
+        main = _FrozenPart(merged)
+        with self._lock:
+            changed = frozenset(index for index, pattern in merged.items()
+                                if self._patterns.get(index) != pattern)
+            main.removed = (changed,) if changed else ()
+            self._main = main
+            self._sealed = []
+            self._delta_patterns = {index: pattern for index, pattern in self._patterns.items()
+                                    if merged.get(index) != pattern}
+            if self._merge_thread is threading.current_thread():
+                self._merge_thread = None
+            self._publish(True)
+
+    def wait_merge(self):
+        """Ожидание завершения фонового слияния, если оно идёт"""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def search(self, text):
+        """Все вхождения актуальных шаблонов: (позиция 1-based, номер) по возрастанию"""
+        parts, delta = self._snapshot
+        matches = []
+        for automaton, removed in parts:
+            found = automaton.search(text)
+            for layer in removed:
+                found = [match for match in found if match[1] not in layer]
+            matches += found
+        if delta is not None:
+            matches += delta.search(text)
+        matches.sort()
+        return matches
+
+# Автомат процесса-исполнителя search_parallel (поверх общей памяти)
+_worker_memory = None
+_worker_automaton = None
+
+def _init_search_worker(name, cls):
+    """Подключение процесса пула к общей памяти с таблицами автомата"""
+    global _worker_memory, _worker_automaton
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    _worker_automaton = cls._from_buffer(_worker_memory.buf)
+
+def _search_segment(task):
+    """Поиск в одном сегменте текста для search_parallel"""
+    segment, report_from, offset = task
+    return _worker_automaton._search_compiled(segment, report_from, offset)
+
+OUTPUT_BUFFER_SIZE = 1 << 20  # Буфер вывода пакетного режима
+
+def _counted_chunks(f, chunk_size, counter):
+    """Блоки двоичного файла с подсчётом прочитанных байт в counter[0]"""
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        counter[0] += len(chunk)
+        yield chunk
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Пакетный поиск шаблонов алгоритмом Ахо-Корасик. "
+                    "Без аргументов программа работает в интерактивном режиме.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-p', '--patterns', metavar='FILE',
+                        help="файл шаблонов, по одному в строке (номер шаблона - номер строки)")
+    source.add_argument('-a', '--automaton', metavar='FILE',
+                        help="скомпилированный автомат, сохранённый --save")
+    parser.add_argument('inputs', nargs='*', metavar='INPUT',
+                        help="файлы для поиска ('-' или ничего - стандартный ввод)")
+    parser.add_argument('-s', '--save', metavar='FILE',
+                        help="сохранить скомпилированный автомат для повторного использования")
+    parser.add_argument('-f', '--format', choices=('tsv', 'jsonl'), default='tsv',
+                        help="формат вывода: строки 'файл позиция шаблон' через табуляцию "
+                             "или JSON lines (по умолчанию tsv)")
+    parser.add_argument('-o', '--output', metavar='FILE', help="файл результатов (по умолчанию stdout)")
+    parser.add_argument('-e', '--encoding', default='utf-8', help="кодировка шаблонов и входа")
+    parser.add_argument('-b', '--bytes', action='store_true',
+                        help="искать в сырых байтах (UTF-8 шаблонов), позиции - в байтах")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="размер блока чтения в байтах")
+    return parser.parse_args(argv)
+
+def run_batch(args):
+    """Пакетный режим: поиск шаблонов в файлах, результаты в TSV / JSON lines"""
+    started = time.perf_counter()
+    if args.automaton:
+        ak = AhoKorasik.load(args.automaton)
+    else:
+        ak = CompactAhoKorasik()
+        with open(args.patterns, encoding=args.encoding) as f:
+            for i, line in enumerate(f, 1):
+                pattern = line.rstrip('\r\n')
+                if pattern:
+                    ak.add_pattern(pattern, i)
+        ak.build_fail_links()
+        ak.compile()
+    if args.save:
+        ak.save(args.save)
+    build_time = time.perf_counter() - started
+
+    output = (open(args.output, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+              if args.output else sys.stdout)
+    write = output.write
+    encoding = None if args.bytes else args.encoding
+    scanned = [0]
+    found = 0
+    started = time.perf_counter()
+    try:
+        for name in args.inputs or ['-']:
+            f = sys.stdin.buffer if name == '-' else open(name, 'rb')
+            try:
+                chunks = _counted_chunks(f, args.chunk_size, scanned)
+                for pos, index in ak.search_stream(chunks, args.chunk_size, encoding):
+                    if args.format == 'tsv':
+                        write(f"{name}\t{pos}\t{index}\n")
+                    else:
+                        write(json.dumps({'file': name, 'pos': pos, 'pattern': index},
+                                         ensure_ascii=False) + '\n')
+                    found += 1
+            finally:
+                if f is not sys.stdin.buffer:
+                    f.close()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+    elapsed = time.perf_counter() - started
+    megabytes = scanned[0] / 1e6
+    print(f"Автомат: {len(ak.fail)} состояний, подготовлен за {build_time:.3f} с; "
+          f"просмотрено {megabytes:.2f} МБ за {elapsed:.3f} с "
+          f"({megabytes / elapsed if elapsed else 0:.2f} МБ/с), совпадений: {found}",
+          file=sys.stderr)
+
+def main(argv=None):
+    """Основная функция: пакетный режим при наличии аргументов, иначе диалог"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_batch(_parse_args(argv))
+
     print("="*50)
     print("Алгоритм Ахо-Корасик")
     print("Введите:")
@@ -208,14 +1666,15 @@ def main():
         pattern = input(f"Введите шаблон {i+1}: ").strip()
         patterns.append(pattern)
 
-    # Построение автомата
-    ak = AhoKorasik()
+    # Построение автомата (с печатью каждого шага)
+    ak = AhoKorasik(observer=print_trace)
     for i, pattern in enumerate(patterns, 1):
         ak.add_pattern(pattern, i)
 
     ak.build_fail_links()
 
-    # Поиск шаблонов в тексте
+    # Поиск шаблонов в тексте по бору: трассировка показывает переходы
+    # по fail-ссылкам, которых у скомпилированной таблицы нет
     matches = ak.search(text)
 
     print("\n" + "="*50)
@@ -1,105 +1,551 @@
+import argparse
+import importlib.util
+import json
+import mmap
+import struct
 import sys
-from collections import deque
+import time
+from array import array
+from collections import deque, namedtuple
+from functools import lru_cache
+
+# Формат файла скомпилированного автомата (см. AhoCorasick.save):
+# заголовок, символы алфавита в UTF-8 (с выравниванием до 4 байт), затем
+# массивы int32 в порядке _TABLES
+AUTOMATON_MAGIC = b'AHOC'
+AUTOMATON_VERSION = 2
+_HEADER = struct.Struct('=4sIIIIIII')
+_BYTE_ORDER_MARK = 0x01020304
+_TABLES = ('delta', 'fail', 'out_start', 'out_patterns', 'out_lengths', 'out_first', 'out_link',
+           'parent', 'edge')
+# Двоичные входы, которые search просматривает по байтам без декодирования
+_BYTES_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Событие трассировки: тип, ID узла (состояния), символ, позиция (0-based)
+# и данные события (индекс паттерна, ID узла ссылки и т.п.)
+TraceEvent = namedtuple('TraceEvent', 'kind node_id char pos detail',
+                        defaults=(None, None, None, None))
+
+# Таблицы ссылок состояний (см. AhoCorasick.compile) без таблицы переходов
+_LinkTables = namedtuple('_LinkTables',
+                         'fail parent edge out_start out_patterns out_lengths out_first out_link')
+
+def print_trace(event):
+    """Наблюдатель, печатающий ход работы автомата (для обучения и отладки)"""
+    kind, node_id, char, pos, detail = event
+    if kind == 'init':
+        print("\n=== Инициализация автомата ===")
+        print(f"Создан корневой узел {node_id}")
+    elif kind == 'add_pattern':
+        print(f"\nДобавление подшаблона '{detail[0]}' (индекс {detail[1]}, длина {detail[2]})")
+    elif kind == 'new_node':
+        print(f"  Создание нового узла {node_id} для символа '{char}'")
+    elif kind == 'goto_node':
+        status = 'последний' if detail else 'промежуточный'
+        print(f"  Переход к узлу {node_id} для '{char}' ({status})")
+    elif kind == 'pattern_end':
+        print(f"  Добавлен выходной паттерн {detail} в конечный узел {node_id}")
+    elif kind == 'failure_links_start':
+        print("\n=== Построение fail-ссылок ===")
+    elif kind == 'fail_link':
+        print(f"  Установка fail-ссылки для '{char}': узел {node_id} -> узел {detail}")
+    elif kind == 'output_link':
+        print(f"  Установка выходной ссылки: узел {node_id} -> узел {detail}")
+    elif kind == 'compiled':
+        print("\n=== Компиляция автомата в таблицу переходов ===")
+        print(f"Таблица переходов: {detail[0]} состояний x {detail[1]} столбцов")
+    elif kind == 'search_start':
+        print(f"\n=== Начало поиска в тексте '{detail}' ===")
+    elif kind == 'char':
+        print(f"\nСимвол [{pos}]: '{char}'")
+        print(f"Текущий узел до обработки: {node_id}")
+    elif kind == 'fail':
+        print(f"  Переход по fail-ссылке: {node_id} -> {detail}")
+    elif kind == 'goto':
+        print(f"  Переход к ребенку: {node_id}")
+    elif kind == 'root':
+        print("  Символ не найден, возврат в корень")
+    elif kind == 'match':
+        print(f"    Запись позиции {pos} для паттерна {detail} (узел {node_id})")
+    elif kind == 'chains_start':
+        print("\n=== Поиск максимальных цепочек ===")
+        print(f"Всего узлов в автомате: {detail}")
+    elif kind == 'chains_done':
+        print("\nИтоги:")
+        print(f"Максимальная длина fail-цепочки: {detail[0]}")
+        print(f"Максимальная длина output-цепочки: {detail[1]}")
 
 class Node:
     """Узел для дерева автомата Ахо-Корасик"""
-    def __init__(self):
+    __slots__ = ('node_id', 'children', 'fail', 'output', 'output_link')
+
+    def __init__(self, node_id):
+        self.node_id = node_id  # Номер узла в порядке создания (для трассировки)
         self.children = {}    # Дочерние узлы (ключ: символ, значение: узел)
         self.fail = None      # Ссылка на узел с наибольшим суффиксом (fail-ссылка)
         self.output = []      # Список паттернов, заканчивающихся в этом узле (индекс, длина)
+        self.output_link = None  # Ближайший по fail-цепочке узел с паттернами
         
     def __repr__(self):
-        return f"Node(output={self.output}, children={list(self.children.keys())})"
+        return f"Node({self.node_id}, output={self.output}, children={list(self.children.keys())})"
 
 class AhoCorasick:
     """Автомат Ахо-Корасик для множественного поиска подстрок"""
-    def __init__(self):
-        self.root = Node()
-        print("\n=== Инициализация автомата ===")
-        print(f"Создан корневой узел: {self.root}")
+    def __init__(self, observer=None):
+        """observer - функция, получающая TraceEvent на каждом шаге построения
+        и поиска (например, print_trace). Без наблюдателя add_pattern и search
+        работают по отдельной ветке кода без проверок и форматирования в циклах.
+        """
+        self.root = Node(0)
+        self.node_counter = 0
+        self.observer = observer
+        self.read_only = False    # Автомат загружен load(): доступен только поиск
+        # Скомпилированный автомат (заполняется в compile)
+        self.alphabet = None      # Символ -> номер столбца таблицы переходов
+        self.n_columns = 0        # Число столбцов (столбец 0 - прочие символы)
+        self.delta = None         # Плоская таблица переходов состояние x столбец
+        self.fail = None          # Суффиксная ссылка состояния
+        self.parent = None        # Родитель состояния в боре (у корня -1)
+        self.edge = None          # Код символа ребра из родителя (у корня -1)
+        self.out_start = None     # Начало списка выходов состояния в out_*
+        self.out_patterns = None  # Индексы паттернов выходов
+        self.out_lengths = None   # Длины паттернов выходов
+        self.out_first = None     # Первое состояние с выходами в цепочке (или -1)
+        self.out_link = None      # Выходная ссылка состояния (или -1)
+        # Байтовый автомат (заполняется в compile_bytes): те же таблицы
+        # для UTF-8 представления паттернов, 256 столбцов на состояние
+        self.byte_delta = None
+        self.byte_out_start = None
+        self.byte_out_patterns = None
+        self.byte_out_lengths = None  # Длины паттернов в байтах
+        self.byte_out_first = None
+        self.byte_out_link = None
+        if observer is not None:
+            observer(TraceEvent('init', 0))
+
+    def _check_writable(self):
+        """Ошибка при попытке изменить или перестроить загруженный автомат"""
+        if self.read_only:
+            raise RuntimeError("Загруженный автомат поддерживает только поиск")
 
     def add_pattern(self, pattern, index, length):
         """Добавление подшаблона в дерево"""
-        print(f"\nДобавление подшаблона '{pattern}' (индекс {index}, длина {length})")
+        self._check_writable()
+        self.delta = None  # Скомпилированные таблицы больше не актуальны
+        self.byte_delta = None
+        if self.observer is not None:
+            return self._add_pattern_traced(pattern, index, length)
+        node = self.root
+        for char in pattern:
+            child = node.children.get(char)
+            if child is None:
+                self.node_counter += 1
+                child = node.children[char] = Node(self.node_counter)
+            node = child
+        node.output.append((index, length))
+
+    def _add_pattern_traced(self, pattern, index, length):
+        """add_pattern с передачей событий наблюдателю"""
+        trace = self.observer
+        trace(TraceEvent('add_pattern', 0, detail=(pattern, index, length)))
         node = self.root
         for i, char in enumerate(pattern):
             # Создаем новый узел, если символ отсутствует
             if char not in node.children:
-                print(f"  Создание нового узла для символа '{char}'")
-                node.children[char] = Node()
+                self.node_counter += 1
+                node.children[char] = Node(self.node_counter)
+                trace(TraceEvent('new_node', self.node_counter, char, i))
             node = node.children[char]
-            status = 'последний' if i == len(pattern)-1 else 'промежуточный'
-            print(f"  Переход к узлу для '{char}' ({status})")
+            trace(TraceEvent('goto_node', node.node_id, char, i, i == len(pattern) - 1))
         # Добавляем информацию о паттерне в конечный узел
         node.output.append((index, length))
-        print(f"  Добавлен выходной паттерн {node.output} в конечный узел")
+        trace(TraceEvent('pattern_end', node.node_id, detail=(index, length)))
 
     def build_failure_links(self):
-        """Построение fail-ссылок с использованием BFS"""
-        print("\n=== Построение fail-ссылок ===")
+        """Построение fail-ссылок с использованием BFS
+
+        Наблюдатель (если есть) проверяется один раз на ребро бора, а не на
+        шаг подъёма по fail-ссылкам.
+        """
+        self._check_writable()
+        trace = self.observer
+        if trace is not None:
+            trace(TraceEvent('failure_links_start'))
         queue = deque()
         # Инициализация fail-ссылок для детей корня
         for char, child in self.root.children.items():
-            print(f"Инициализация fail-ссылки для корневого ребенка '{char}'")
             child.fail = self.root
             queue.append(child)
+            if trace is not None:
+                trace(TraceEvent('fail_link', child.node_id, char, detail=0))
 
         while queue:
             current_node = queue.popleft()
-            print(f"\nОбработка узла {current_node}")
             for char, child in current_node.children.items():
-                print(f"\n  Обработка ребенка '{char}'")
                 fail_node = current_node.fail
-                steps = 0
                 
                 # Поиск подходящего суффикса
-                print(f"  Поиск fail-ссылки для '{char}':")
                 while fail_node is not None and char not in fail_node.children:
-                    print(f"    Шаг {steps}: переход по fail к {fail_node}")
                     fail_node = fail_node.fail
-                    steps += 1
 
                 # Установка fail-ссылки для текущего ребенка
                 child.fail = fail_node.children[char] if fail_node else self.root
-                print(f"  Установка fail-ссылки: {child.fail}")
                 
-                # Наследование выходов от fail-узла
-                child.output += child.fail.output
-                if child.output:
-                    print(f"  Объединение выходов: {child.output}")
+                # Выходная ссылка на ближайший узел fail-цепочки с паттернами
+                # (выходы fail-узла не копируются)
+                fail = child.fail
+                child.output_link = fail if fail.output else fail.output_link
+                if trace is not None:
+                    trace(TraceEvent('fail_link', child.node_id, char, detail=fail.node_id))
+                    if child.output_link:
+                        trace(TraceEvent('output_link', child.node_id, detail=child.output_link.node_id))
                 
                 queue.append(child)
-                print(f"  Добавлен в очередь: {child}")
+
+    def compile(self):
+        """Компиляция автомата в плотную таблицу переходов (ДКА)
+
+        Вызывается после build_failure_links. Номер состояния совпадает с
+        node_id, каждому символу подшаблонов назначается столбец (столбец 0 -
+        все прочие символы). Поиск по таблице выполняет ровно одно обращение
+        к ней на символ текста, без прохода по fail-ссылкам.
+        """
+        self._check_writable()
+        # При обходе в ширину fail-узел имеет меньшую глубину, значит его
+        # строка таблицы уже заполнена к моменту обработки узла
+        nodes, tables = self._trie_tables()
+        chars = set()
+        for node in nodes:
+            chars.update(node.children)
+
+        alphabet = {char: col for col, char in enumerate(sorted(chars), 1)}
+        k = len(alphabet) + 1
+        delta = array('i', [0]) * (len(nodes) * k)
+        for node in nodes:
+            base = node.node_id * k
+            if node is not self.root:
+                fail_base = node.fail.node_id * k
+                delta[base:base + k] = delta[fail_base:fail_base + k]
+            for char, child in node.children.items():
+                delta[base + alphabet[char]] = child.node_id
+
+        self.alphabet = alphabet
+        self.n_columns = k
+        self.delta = delta
+        for name, table in zip(_LinkTables._fields, tables):
+            setattr(self, name, table)
+        if self.observer is not None:
+            self.observer(TraceEvent('compiled', detail=(len(nodes), k)))
+
+    def _trie_tables(self):
+        """Узлы бора в порядке обхода в ширину и таблицы ссылок состояний
+
+        Собственные выходы состояния s лежат в out_*[out_start[s]:out_start[s + 1]],
+        остальные находятся переходом по выходным ссылкам out_link. Время и
+        память линейны по числу состояний и паттернов.
+        """
+        nodes = self.collect_all_nodes()
+        parent = array('i', [-1]) * len(nodes)
+        edge = array('i', [-1]) * len(nodes)
+        for node in nodes:
+            if node is not self.root and node.fail is None:
+                raise RuntimeError("Сначала нужно вызвать build_failure_links()")
+            for char, child in node.children.items():
+                parent[child.node_id] = node.node_id
+                edge[child.node_id] = ord(char)
+
+        out_start = array('i', [0])
+        out_patterns = array('i')
+        out_lengths = array('i')
+        out_first = array('i')
+        out_link = array('i')
+        fail = array('i')
+        for node in sorted(nodes, key=lambda n: n.node_id):
+            fail.append(node.fail.node_id if node.fail else 0)
+            for pattern_index, length in node.output:
+                out_patterns.append(pattern_index)
+                out_lengths.append(length)
+            out_start.append(len(out_patterns))
+            link = node.output_link.node_id if node.output_link else -1
+            out_link.append(link)
+            out_first.append(node.node_id if node.output else link)
+        return nodes, _LinkTables(fail, parent, edge, out_start, out_patterns,
+                                  out_lengths, out_first, out_link)
+
+    def compile_bytes(self):
+        """Компиляция байтового ДКА для поиска в bytes / memoryview / mmap
+
+        Строится по таблицам compile() (вызывается при необходимости):
+        каждое ребро бора разворачивается в цепочку рёбер по байтам UTF-8
+        представления символа, столбец таблицы - значение байта. Длины
+        выходов пересчитываются в байты (глубина состояния в байтовом боре).
+        """
+        if self.delta is None:
+            self.compile()
+        parent = self.parent
+        edge = self.edge
+        out_start = self.out_start
+        out_patterns = self.out_patterns
+        n = len(self.fail)
+
+        # Байтовый бор (ключ: байтовое состояние << 8 | байт); номер родителя
+        # состояния всегда меньше номера самого состояния
+        goto = {}
+        state_of = array('i', [0]) * n
+        depth = [0]
+        for s in range(1, n):
+            state = state_of[parent[s]]
+            for byte in chr(edge[s]).encode('utf-8', 'surrogatepass'):
+                key = state << 8 | byte
+                next_state = goto.get(key)
+                if next_state is None:
+                    next_state = goto[key] = len(depth)
+                    depth.append(depth[state] + 1)
+                state = next_state
+            state_of[s] = state
+
+        m = len(depth)
+        children = [[] for _ in range(m)]
+        for key, target in goto.items():
+            children[key >> 8].append((key & 255, target))
+
+        delta = array('i', [0]) * (m << 8)
+        fail = array('i', [0]) * m
+        order = []
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            base = state << 8
+            if state:
+                fail_base = fail[state] << 8
+                delta[base:base + 256] = delta[fail_base:fail_base + 256]
+            for byte, child in children[state]:
+                fail[child] = delta[base + byte]
+                delta[base + byte] = child
+                queue.append(child)
+
+        owner = array('i', [-1]) * m
+        for s in range(n):
+            if out_start[s] < out_start[s + 1]:
+                owner[state_of[s]] = s
+        byte_out_start = array('i', [0])
+        byte_out_patterns = array('i')
+        byte_out_lengths = array('i')
+        for state in range(m):
+            s = owner[state]
+            if s >= 0:
+                for j in range(out_start[s], out_start[s + 1]):
+                    byte_out_patterns.append(out_patterns[j])
+                    byte_out_lengths.append(depth[state])
+            byte_out_start.append(len(byte_out_patterns))
+
+        byte_out_first = array('i', [-1]) * m
+        byte_out_link = array('i', [-1]) * m
+        for state in order:
+            link = byte_out_first[fail[state]] if state else -1
+            byte_out_link[state] = link
+            byte_out_first[state] = state if owner[state] >= 0 else link
+
+        self.byte_delta = delta
+        self.byte_out_start = byte_out_start
+        self.byte_out_patterns = byte_out_patterns
+        self.byte_out_lengths = byte_out_lengths
+        self.byte_out_first = byte_out_first
+        self.byte_out_link = byte_out_link
+
+    def save(self, path):
+        """Сохранение скомпилированного автомата в файл для load()"""
+        if self.delta is None:
+            raise RuntimeError("Сначала нужно вызвать compile()")
+        chars = sorted(self.alphabet)
+        encoded = ''.join(chars).encode('utf-8', 'surrogatepass')
+        padding = -len(encoded) % 4
+        header = _HEADER.pack(AUTOMATON_MAGIC, AUTOMATON_VERSION, _BYTE_ORDER_MARK,
+                              len(self.fail), self.n_columns, len(self.out_patterns),
+                              len(chars), len(encoded))
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.write(encoded + b'\0' * padding)
+            f.write(array('i', [self.alphabet[char] for char in chars]))
+            for name in _TABLES:
+                f.write(getattr(self, name))
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка автомата, сохранённого save(), через отображение файла в память
+
+        Таблицы не копируются, а читаются как memoryview поверх mmap: процессы
+        разделяют страницы файла, загрузка не зависит от размера таблиц.
+        Загруженный автомат поддерживает только поиск.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls._from_buffer(memoryview(buffer))
+
+    @classmethod
+    def _from_buffer(cls, view):
+        """Создание автомата поверх буфера в формате save()"""
+        (magic, version, byte_order, n_states, n_columns, n_outputs,
+         n_chars, chars_size) = _HEADER.unpack_from(view)
+        if magic != AUTOMATON_MAGIC or version != AUTOMATON_VERSION:
+            raise ValueError("Неизвестный формат файла автомата")
+        if byte_order != _BYTE_ORDER_MARK:
+            raise ValueError("Файл автомата сохранён на платформе с другим порядком байт")
+
+        offset = _HEADER.size
+        chars = str(view[offset:offset + chars_size], 'utf-8', 'surrogatepass')
+        offset += chars_size + (-chars_size % 4)
+        sizes = {
+            'delta': n_states * n_columns,
+            'fail': n_states,
+            'out_start': n_states + 1,
+            'out_patterns': n_outputs,
+            'out_lengths': n_outputs,
+            'out_first': n_states,
+            'out_link': n_states,
+            'parent': n_states,
+            'edge': n_states,
+        }
+        columns = view[offset:offset + 4 * n_chars].cast('i')
+        offset += 4 * n_chars
+
+        automaton = cls()
+        automaton.alphabet = dict(zip(chars, columns))
+        automaton.n_columns = n_columns
+        for name in _TABLES:
+            size = 4 * sizes[name]
+            setattr(automaton, name, view[offset:offset + size].cast('i'))
+            offset += size
+        automaton.read_only = True
+        return automaton
+
+    def _search_compiled(self, text):
+        """Поиск по скомпилированной таблице переходов"""
+        delta = self.delta
+        k = self.n_columns
+        column = self.alphabet.get
+        out_start = self.out_start
+        out_patterns = self.out_patterns
+        out_lengths = self.out_lengths
+        out_first = self.out_first
+        out_link = self.out_link
+        state = 0
+        result = []
+        for i, char in enumerate(text):
+            state = delta[state * k + column(char, 0)]
+            report = out_first[state]
+            while report >= 0:
+                for j in range(out_start[report], out_start[report + 1]):
+                    result.append((i - out_lengths[j] + 1, out_patterns[j]))
+                report = out_link[report]
+        return result
+
+    def _search_bytes(self, data):
+        """Поиск в двоичных данных по байтовой таблице (позиции - в байтах)"""
+        if self.byte_delta is None:
+            self.compile_bytes()
+        delta = self.byte_delta
+        out_start = self.byte_out_start
+        out_patterns = self.byte_out_patterns
+        out_lengths = self.byte_out_lengths
+        out_first = self.byte_out_first
+        out_link = self.byte_out_link
+        state = 0
+        result = []
+        with memoryview(data) as view, view.cast('B') as octets:
+            for i, byte in enumerate(octets):
+                state = delta[state << 8 | byte]
+                report = out_first[state]
+                while report >= 0:
+                    for j in range(out_start[report], out_start[report + 1]):
+                        result.append((i - out_lengths[j] + 1, out_patterns[j]))
+                    report = out_link[report]
+        return result
+
+    def _search_compiled_traced(self, text):
+        """_search_compiled с передачей событий наблюдателю (ID - номер состояния)"""
+        trace = self.observer
+        trace(TraceEvent('search_start', detail=text))
+        state = 0
+        result = []
+        for i, char in enumerate(text):
+            trace(TraceEvent('char', state, char, i))
+            state = self.delta[state * self.n_columns + self.alphabet.get(char, 0)]
+            if state:
+                trace(TraceEvent('goto', state, char, i))
+            else:
+                trace(TraceEvent('root', 0, char, i))
+            report = self.out_first[state]
+            while report >= 0:
+                for j in range(self.out_start[report], self.out_start[report + 1]):
+                    pos = i - self.out_lengths[j] + 1
+                    trace(TraceEvent('match', report, char, pos, self.out_patterns[j]))
+                    result.append((pos, self.out_patterns[j]))
+                report = self.out_link[report]
+        return result
 
     def search(self, text):
-        """Поиск всех подшаблонов в тексте"""
-        print(f"\n=== Начало поиска в тексте '{text}' ===")
+        """Поиск всех подшаблонов в тексте
+
+        Двоичные данные (bytes, bytearray, memoryview, mmap) просматриваются
+        байтовым автоматом без копирования, позиции - смещения в байтах.
+        """
+        if isinstance(text, _BYTES_TYPES):
+            return self._search_bytes(text)
+        if self.delta is not None:
+            if self.observer is not None:
+                return self._search_compiled_traced(text)
+            return self._search_compiled(text)
+        if self.observer is not None:
+            return self._search_traced(text)
+        root = self.root
+        node = root
+        result = []
+        for i, char in enumerate(text):
+            # Переход по fail-ссылкам до нахождения совпадения или корня
+            while node is not root and char not in node.children:
+                node = node.fail
+            node = node.children.get(char, root)
+
+            # Собираем паттерны узла и его цепочки выходных ссылок
+            out_node = node if node.output else node.output_link
+            while out_node is not None:
+                for pattern_index, length in out_node.output:
+                    result.append((i - length + 1, pattern_index))
+                out_node = out_node.output_link
+        return result
+
+    def _search_traced(self, text):
+        """Поиск по бору с передачей событий наблюдателю"""
+        trace = self.observer
+        trace(TraceEvent('search_start', detail=text))
         node = self.root
         result = []
         for i, char in enumerate(text):
-            print(f"\nСимвол [{i}]: '{char}'")
-            print(f"Текущий узел до обработки: {node}")
+            trace(TraceEvent('char', node.node_id, char, i))
             
             # Переход по fail-ссылкам до нахождения совпадения или корня
             while node != self.root and char not in node.children:
-                print(f"  Переход по fail-ссылке: {node} -> {node.fail}")
+                trace(TraceEvent('fail', node.node_id, char, i, node.fail.node_id))
                 node = node.fail
 
             # Переход к следующему узлу
             if char in node.children:
                 node = node.children[char]
-                print(f"  Переход к ребенку: {node}")
+                trace(TraceEvent('goto', node.node_id, char, i))
             else:  # Остаемся в корне, если символ не найден
-                print("  Символ не найден, возврат в корень")
+                trace(TraceEvent('root', 0, char, i))
                 node = self.root
                 
-            # Собираем все найденные паттерны
-            if node.output:
-                print(f"  Найдены выходы: {node.output}")
-                for pattern_index, length in node.output:
+            # Собираем паттерны узла и его цепочки выходных ссылок
+            out_node = node if node.output else node.output_link
+            while out_node is not None:
+                for pattern_index, length in out_node.output:
                     pos = i - length + 1
-                    print(f"    Запись позиции {pos} для паттерна {pattern_index}")
+                    trace(TraceEvent('match', out_node.node_id, char, pos, pattern_index))
                     result.append((pos, pattern_index))
+                out_node = out_node.output_link
         return result
 
     def collect_all_nodes(self):
@@ -113,162 +559,578 @@ class AhoCorasick:
                 queue.append(child)
         return nodes
 
-    def get_longest_chains(self):
-        """Поиск максимальных цепочек fail и output ссылок"""
-        print("\n=== Поиск максимальных цепочек ===")
-        nodes = self.collect_all_nodes()
-        max_fail_chain = 0
-        max_output_chain = 0
-        
-        print(f"Всего узлов в автомате: {len(nodes)}")
-        
-        for i, node in enumerate(nodes):
-            print(f"\nАнализ узла {i + 1}: {node}")
-            
-            # Анализ fail-цепочки
-            fail_chain = []
-            current = node
-            while current != self.root:
-                fail_chain.append(current)
-                current = current.fail
-            fail_length = len(fail_chain)
-            
-            print(f"  Fail-цепочка (длина {fail_length}):")
-            chain = [f"Узел {i + 1}"] + [f"-> Fail {n}" for n in fail_chain]
-            print("   " + " ".join(chain))
-            
-            if fail_length > max_fail_chain:
-                print(f"  Новый максимум fail-цепи: {fail_length}")
-                max_fail_chain = fail_length
-
-            # Анализ output-цепочки
-            output_chain = []
-            current = node
-            while current.output or (current.fail and current.fail != current):
-                output_chain.append(current)
-                current = current.fail
-            output_length = len(output_chain)
-            
-            print(f"  Output-цепочка (длина {output_length}):")
-            chain = [f"Узел {i + 1}"] + [f"-> {n}" for n in output_chain[1:]]
-            print("   " + " ".join(chain))
-            
-            if output_length > max_output_chain:
-                print(f"  Новый максимум output-цепи: {output_length}")
-                max_output_chain = output_length
+    def statistics(self):
+        """Статистика автомата за один проход в ширину, без печати
 
-        print("\nИтоги:")
-        print(f"Максимальная длина fail-цепочки: {max_fail_chain}")
-        print(f"Максимальная длина output-цепочки: {max_output_chain}")
-        return max_fail_chain, max_output_chain
+        Длина fail-цепочки состояния на 1 больше, чем у его fail-узла; длина
+        output-цепочки - как у fail-узла плюс 1, если в состоянии
+        заканчивается паттерн. Возвращает словарь с ключами states, patterns,
+        accepting_states, leaves, max_depth, max_fail_chain, max_output_chain,
+        depth_histogram (список по глубинам) и fanout_distribution
+        (число детей -> число состояний). Автомат не компилируется: если
+        таблица переходов не построена или устарела, ссылки берутся из бора.
+        """
+        if self.delta is not None:
+            tables = _LinkTables(*(getattr(self, name) for name in _LinkTables._fields))
+        else:
+            tables = self._trie_tables()[1]
+        fail = tables.fail
+        parent = tables.parent
+        out_start = tables.out_start
+        n = len(fail)
 
-def find_wildcard_matches(text, pattern, wildcard):
-    """Поиск шаблонов с джокерами в тексте"""
-    print("\n" + "="*50)
-    print(f"Начало обработки:\nТекст: '{text}'\nШаблон: '{pattern}'\nДжокер: '{wildcard}'")
-    
-    # Этап 1: Разделение шаблона на подшаблоны
-    print("\n=== Шаг 1: Разделение шаблона на подшаблоны ===")
-    subpatterns = []
-    current = []
-    for char in pattern:
+        # Родитель создаётся раньше ребёнка: глубины считаются по возрастанию номеров
+        depth = array('i', [0]) * n
+        fanout = array('i', [0]) * n
+        for s in range(1, n):
+            depth[s] = depth[parent[s]] + 1
+            fanout[parent[s]] += 1
+        max_depth = max(depth, default=0)
+        depth_histogram = [0] * (max_depth + 1)
+        for d in depth:
+            depth_histogram[d] += 1
+
+        # Порядок обхода в ширину - сортировка подсчётом по глубине
+        starts = [0] * (max_depth + 2)
+        for d in range(max_depth + 1):
+            starts[d + 1] = starts[d] + depth_histogram[d]
+        order = array('i', [0]) * n
+        for s in range(n):
+            order[starts[depth[s]]] = s
+            starts[depth[s]] += 1
+
+        fail_chain = array('i', [0]) * n
+        output_chain = array('i', [0]) * n
+        for s in order:
+            if s:
+                f = fail[s]
+                fail_chain[s] = fail_chain[f] + 1
+                output_chain[s] = output_chain[f] + (out_start[s] != out_start[s + 1])
+
+        fanout_distribution = {}
+        for count in fanout:
+            fanout_distribution[count] = fanout_distribution.get(count, 0) + 1
+        return {
+            'states': n,
+            'patterns': len(tables.out_patterns),
+            'accepting_states': sum(out_start[s] != out_start[s + 1] for s in range(n)),
+            'leaves': fanout_distribution.get(0, 0),
+            'max_depth': max_depth,
+            'max_fail_chain': max(fail_chain, default=0),
+            'max_output_chain': max(output_chain, default=0),
+            'depth_histogram': depth_histogram,
+            'fanout_distribution': fanout_distribution,
+        }
+
+    def get_longest_chains(self):
+        """Максимальные длины цепочек fail и output ссылок (см. statistics)"""
+        stats = self.statistics()
+        if self.observer is not None:
+            self.observer(TraceEvent('chains_start', detail=stats['states']))
+            self.observer(TraceEvent('chains_done',
+                                     detail=(stats['max_fail_chain'], stats['max_output_chain'])))
+        return stats['max_fail_chain'], stats['max_output_chain']
+
+def _split_wildcard_pattern(pattern, wildcard):
+    """Подшаблоны (участки без джокеров) шаблона: пары (смещение, подшаблон)"""
+    current_start = None
+    for i, char in enumerate(pattern):
         if char == wildcard:
-            if current:
-                subpat = ''.join(current)
-                subpatterns.append(subpat)
-                print(f"Найден подшаблон: '{subpat}'")
-                current = []
-        else:
-            current.append(char)
-    if current:
-        subpat = ''.join(current)
-        subpatterns.append(subpat)
-        print(f"Найден подшаблон: '{subpat}'")
-    
-    print(f"\nИтоговые подшаблоны: {subpatterns}")
-    if not subpatterns:
-        print("Нет подшаблонов для поиска")
-        return []
+            if current_start is not None:
+                yield current_start, pattern[current_start:i]
+                current_start = None
+        elif current_start is None:
+            current_start = i
+    if current_start is not None:
+        yield current_start, pattern[current_start:]
 
-    # Этап 2: Построение автомата
-    print("\n=== Шаг 2: Построение автомата Ахо-Корасик ===")
-    ac = AhoCorasick()
-    for i, subpattern in enumerate(subpatterns):
-        ac.add_pattern(subpattern, i + 1, len(subpattern))
-    
-    # Этап 3: Построение fail-ссылок
-    print("\n=== Шаг 3: Построение fail-ссылок ===")
-    ac.build_failure_links()
-    
-    # Этап 3a: Анализ цепочек
-    ac.get_longest_chains()
+class WildcardPattern:
+    """Шаблон с джокерами, скомпилированный один раз для поиска во многих текстах
 
-    # Этап 4: Поиск подшаблонов
-    print("\n=== Шаг 4: Поиск подшаблонов в тексте ===")
-    matches = ac.search(text)
-    print(f"\nВсе совпадения подшаблонов: {matches}")
-    
-    # Группировка позиций по подшаблонам
-    subpattern_positions = [[] for _ in range(len(subpatterns))]
-    for pos, subpat_idx in matches:
-        subpattern_positions[subpat_idx - 1].append(pos)
-    
-    # Этап 5: Проверка полных совпадений
-    print("\n=== Шаг 5: Поиск полных совпадений с учетом джокеров ===")
-    print(f"Позиции подшаблонов: {subpattern_positions}")
-    result = set()
-    pattern_length = len(pattern)
-    text_length = len(text)
-    
-    for i in range(len(subpatterns)):
-        subpat = subpatterns[i]
-        print(f"\nПроверка подшаблона {i+1} ('{subpat}'):")
-        
-        for pos in subpattern_positions[i]:
-            # Вычисление предполагаемой стартовой позиции
-            start_in_pattern = pattern.find(subpat)
-            global_start = pos - start_in_pattern
-            global_end = global_start + pattern_length
-            
-            print(f"\n  Возможное совпадение на позиции {pos}")
-            print(f"  Предполагаемый старт в тексте: {global_start}")
-            print(f"  Предполагаемый конец в тексте: {global_end}")
-            
-            # Проверка границ текста
-            if global_start < 0:
-                print("  Отклонено: старт позиция меньше 0")
-                continue
-            if global_end > text_length:
-                print("  Отклонено: выход за границы текста")
+    Различные подшаблоны (участки шаблона без джокеров) загружаются в один
+    автомат Ахо-Корасик. При поиске каждое вхождение подшаблона голосует за
+    предполагаемую позицию начала шаблона (позиция вхождения минус смещение
+    подшаблона в шаблоне); шаблон начинается там, где число голосов равно
+    числу подшаблонов. Время поиска O(|текст| + число вхождений), без
+    посимвольной проверки кандидатов.
+    """
+    def __init__(self, pattern, wildcard, automaton, subpattern_offsets):
+        self.pattern = pattern
+        self.wildcard = wildcard
+        self.automaton = automaton                    # None, если подшаблонов нет
+        self.subpattern_offsets = subpattern_offsets  # Смещения подшаблона по его индексу
+        self.occurrences = sum(len(offsets) for offsets in subpattern_offsets)
+
+    @classmethod
+    def compile(cls, pattern, wildcard, observer=None):
+        """Разбор шаблона на подшаблоны со смещениями и построение автомата
+
+        observer передаётся автомату подшаблонов (см. AhoCorasick); с
+        наблюдателем автомат не компилируется, чтобы трассировка поиска
+        показывала проход по fail-ссылкам бора.
+        """
+        offsets = {}  # Подшаблон -> список его смещений в шаблоне
+        for offset, subpattern in _split_wildcard_pattern(pattern, wildcard):
+            offsets.setdefault(subpattern, []).append(offset)
+
+        automaton = None
+        if offsets:
+            automaton = AhoCorasick(observer)
+            for i, subpattern in enumerate(offsets):
+                automaton.add_pattern(subpattern, i, len(subpattern))
+            automaton.build_failure_links()
+            if observer is None:
+                automaton.compile()
+        return cls(pattern, wildcard, automaton, list(offsets.values()))
+
+    def search(self, text):
+        """Позиции (1-based, по возрастанию) всех вхождений шаблона в текст"""
+        last_start = len(text) - len(self.pattern)
+        if self.automaton is None or last_start < 0:
+            return []
+        votes = array('i', [0]) * (last_start + 1)
+        subpattern_offsets = self.subpattern_offsets
+        for pos, subpat_idx in self.automaton.search(text):
+            for offset in subpattern_offsets[subpat_idx]:
+                start = pos - offset
+                if 0 <= start <= last_start:
+                    votes[start] += 1
+        occurrences = self.occurrences
+        return [start + 1 for start, count in enumerate(votes) if count == occurrences]
+
+    def search_many(self, texts):
+        """Поиск шаблона в каждом тексте: список результатов search()"""
+        return [self.search(text) for text in texts]
+
+FFT_BLOCK_SIZE = 1 << 16       # Наименьший размер БПФ для блока текста
+FFT_MAX_SUM = 1 << 42          # Граница слагаемых суммы, при которой float64 ещё точен
+FFT_LONG_PATTERN_LENGTH = 1024 # Шаблоны от этой длины auto ищет через БПФ
+SHIFT_AND_MAX_LENGTH = 64      # Машинное слово: шаблоны не длиннее ищет Shift-And
+SHIFT_AND_MIN_BATCH = 16       # С какого числа текстов search_many векторизуется
+SHIFT_AND_BLOCK_CELLS = 1 << 20  # Ячеек (позиция x текст) в блоке search_many
+
+def _import_numpy():
+    """NumPy нужен только FFT-движку и импортируется при первом использовании"""
+    try:
+        import numpy
+    except ImportError as error:
+        raise ImportError("Для FFT-поиска с джокерами нужен пакет numpy") from error
+    return numpy
+
+def _next_power_of_two(n):
+    return 1 << max(n - 1, 0).bit_length()
+
+def _encode_text(np, keys, other, text):
+    """Коды символов текста: номер в отсортированном keys + 1 или other
+
+    Без цикла по символам: код символа из keys ищется двоичным поиском
+    по массиву кодовых точек текста.
+    """
+    code_points = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    found = np.searchsorted(keys, code_points)
+    known = keys[np.minimum(found, len(keys) - 1)] == code_points
+    return np.where(known, found + 1, other)
+
+class FFTWildcardPattern:
+    """Шаблон с джокерами, сопоставляемый через быстрое преобразование Фурье
+
+    Символы шаблона кодируются числами 1..σ, джокер - нулём, символы
+    текста, которых нет в шаблоне, - числом σ + 1. Для позиции j сумма
+
+        S(j) = Σ p_i t_{i+j} (p_i - t_{i+j})²
+
+    равна нулю, если все символы шаблона, кроме джокеров, совпадают с
+    текстом, и не меньше 2 иначе. Раскрыв квадрат, S получаем из трёх
+    корреляций (p³ с t, p² с t², p с t³), которые считаются через rfft
+    блоками текста длиной O(m): время O(n log m) без цикла по символам на
+    Python. Спектры шаблона вычисляются один раз для каждого размера БПФ.
+    Интерфейс и результаты те же, что у WildcardPattern.
+    """
+    def __init__(self, pattern, wildcard):
+        np = _import_numpy()
+        if not self.fits(pattern, wildcard):
+            raise ValueError("Слишком много различных символов в шаблоне для точного FFT-поиска")
+        self.pattern = pattern
+        self.wildcard = wildcard
+        chars = sorted(set(pattern) - {wildcard})
+        self.keys = np.array([ord(char) for char in chars], dtype=np.uint32)
+        self.other = len(chars) + 1  # Код символов текста, которых нет в шаблоне
+        code = {char: i for i, char in enumerate(chars, 1)}
+        self.reversed_codes = np.array([code.get(char, 0) for char in reversed(pattern)],
+                                       dtype=np.float64)
+        self.fft_size = _next_power_of_two(max(4 * len(pattern), FFT_BLOCK_SIZE))
+        self._spectra = {}  # Размер БПФ -> спектры p, p², p³ (шаблон развёрнут)
+
+    @classmethod
+    def compile(cls, pattern, wildcard):
+        return cls(pattern, wildcard)
+
+    @staticmethod
+    def fits(pattern, wildcard):
+        """Укладываются ли слагаемые S(j) в точность float64 (см. FFT_MAX_SUM)"""
+        other = len(set(pattern) - {wildcard}) + 1
+        return other ** 4 * len(pattern) <= FFT_MAX_SUM
+
+    def _pattern_spectra(self, size):
+        spectra = self._spectra.get(size)
+        if spectra is None:
+            np = _import_numpy()
+            p = self.reversed_codes
+            spectra = self._spectra[size] = (np.fft.rfft(p, size), np.fft.rfft(p * p, size),
+                                             np.fft.rfft(p * p * p, size))
+        return spectra
+
+    def search(self, text):
+        """Позиции (1-based, по возрастанию) всех вхождений шаблона в текст"""
+        m = len(self.pattern)
+        n = len(text)
+        if not len(self.keys) or m > n:
+            return []
+        np = _import_numpy()
+        rfft = np.fft.rfft
+        size = min(self.fft_size, _next_power_of_two(n))
+        p1, p2, p3 = self._pattern_spectra(size)
+        codes = _encode_text(np, self.keys, self.other, text).astype(np.float64)
+        last_start = n - m
+        step = size - m + 1  # Позиций шаблона на блок
+        result = []
+        for start in range(0, last_start + 1, step):
+            t = codes[start:start + size]
+            t2 = t * t
+            total = np.fft.irfft(p3 * rfft(t, size) - 2 * p2 * rfft(t2, size)
+                                 + p1 * rfft(t2 * t, size), size)
+            count = min(step, last_start + 1 - start)
+            # S(j) - целое число, 0 или не меньше 2, поэтому порог 1 с запасом
+            # покрывает погрешность вычислений
+            hits = np.flatnonzero(total[m - 1:m - 1 + count] < 1.0)
+            result.extend((hits + start + 1).tolist())
+        return result
+
+    def search_many(self, texts):
+        """Поиск шаблона в каждом тексте: список результатов search()"""
+        return [self.search(text) for text in texts]
+
+class ShiftAndWildcardPattern:
+    """Шаблон с джокерами не длиннее машинного слова, сопоставляемый Shift-And
+
+    Для каждого символа шаблона хранится маска позиций, на которых он может
+    стоять; биты позиций джокера установлены во всех масках, в том числе в
+    маске прочих символов. Состояние - биты префиксов шаблона, совпадающих
+    с концом прочитанного текста, и на символ текста приходится один сдвиг,
+    ИЛИ и И. search_many обрабатывает пачку текстов одновременно: состояния
+    всех текстов лежат в массиве numpy.uint64 (если numpy установлен).
+    Интерфейс и результаты те же, что у WildcardPattern.
+    """
+    def __init__(self, pattern, wildcard):
+        if len(pattern) > SHIFT_AND_MAX_LENGTH:
+            raise ValueError(f"Shift-And работает с шаблонами длиной до {SHIFT_AND_MAX_LENGTH}")
+        self.pattern = pattern
+        self.wildcard = wildcard
+        any_mask = 0  # Позиции джокеров
+        for i, char in enumerate(pattern):
+            if char == wildcard:
+                any_mask |= 1 << i
+        masks = {}
+        for i, char in enumerate(pattern):
+            if char != wildcard:
+                masks[char] = masks.get(char, any_mask) | 1 << i
+        self.masks = masks        # Символ шаблона -> маска позиций
+        self.any_mask = any_mask  # Маска символов, которых нет в шаблоне
+        self.accept = 1 << (len(pattern) - 1) if pattern else 0
+
+    @classmethod
+    def compile(cls, pattern, wildcard):
+        return cls(pattern, wildcard)
+
+    def search(self, text):
+        """Позиции (1-based, по возрастанию) всех вхождений шаблона в текст"""
+        m = len(self.pattern)
+        if not self.masks or m > len(text):
+            return []
+        mask = self.masks.get
+        other = self.any_mask
+        accept = self.accept
+        state = 0
+        result = []
+        for i, char in enumerate(text):
+            state = (state << 1 | 1) & mask(char, other)
+            if state & accept:
+                result.append(i - m + 2)
+        return result
+
+    def search_many(self, texts):
+        """Поиск шаблона в каждом тексте: список результатов search()
+
+        Тексты упорядочиваются по длине и режутся на блоки не больше
+        SHIFT_AND_BLOCK_CELLS ячеек (позиция x текст); тексты блока
+        кодируются одним вызовом _encode_text для их конкатенации. Блок
+        обрабатывается по позициям: одна векторная операция сдвига, ИЛИ и И на символ сразу
+        для всех его текстов, короткие тексты дополняются кодом с нулевой
+        маской. Блоки меньше SHIFT_AND_MIN_BATCH текстов (длинные тексты)
+        ищутся через search(): накладные расходы numpy на позицию в них не
+        окупаются.
+        """
+        texts = list(texts)
+        if (len(texts) < SHIFT_AND_MIN_BATCH or not self.masks
+                or importlib.util.find_spec('numpy') is None):
+            return [self.search(text) for text in texts]
+        np = _import_numpy()
+        m = len(self.pattern)
+        chars = sorted(self.masks)
+        keys = np.array([ord(char) for char in chars], dtype=np.uint32)
+        # Код 0 - дополнение, 1..σ - символы шаблона, σ + 1 - прочие символы
+        table = np.array([0, *(self.masks[char] for char in chars), self.any_mask],
+                         dtype=np.uint64)
+        lengths = [len(text) for text in texts]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+        one = np.uint64(1)
+        accept = np.uint64(self.accept)
+        result = [None] * len(texts)
+        begin = 0
+        while begin < len(order):
+            end = begin + 1
+            while end < len(order) and (end - begin + 1) * lengths[order[end]] <= SHIFT_AND_BLOCK_CELLS:
+                end += 1
+            block = order[begin:end]
+            begin = end
+            if len(block) < SHIFT_AND_MIN_BATCH:
+                for column in block:
+                    result[column] = self.search(texts[column])
                 continue
-                
-            # Поэлементная проверка совпадения с шаблоном
-            valid = True
-            print("  Проверка соответствия символов:")
-            for j in range(pattern_length):
-                text_char = text[global_start + j] if (global_start + j) < text_length else None
-                pattern_char = pattern[j]
-                
-                if pattern_char == wildcard:
-                    status = "Джокер - пропуск"
-                elif text_char == pattern_char:
-                    status = "Совпадение"
-                else:
-                    status = "Несовпадение"
-                    valid = False
-                
-                print(f"    Позиция {j}: T '{text_char}' vs P '{pattern_char}' - {status}")
-                if not valid: break
-                    
-            if valid:
-                print(f"  Полное совпадение! Добавлена позиция {global_start + 1}")
-                result.add(global_start + 1)
-    
-    print("\n=== Итоговые совпадения ===")
-    return sorted(result)
 
-def main():
-    """Основная функция для ввода/вывода"""
+            # Последний элемент codes - дополнение для позиций за концом текста
+            codes = np.append(_encode_text(np, keys, len(chars) + 1,
+                                           ''.join([texts[column] for column in block])), 0)
+            block_lengths = np.array([lengths[column] for column in block], dtype=np.intp)
+            starts = np.cumsum(block_lengths) - block_lengths
+            width = lengths[block[-1]]
+            positions = np.arange(width, dtype=np.intp)[:, None]
+            index = np.where(positions < block_lengths, starts + positions, len(codes) - 1)
+            masks = table[codes[index]]
+            state = np.zeros(len(block), dtype=np.uint64)
+            found = [[] for _ in block]
+            for i in range(width):
+                state = ((state << one) | one) & masks[i]
+                for column in np.flatnonzero(state & accept).tolist():
+                    found[column].append(i - m + 2)
+            for column, positions_found in zip(block, found):
+                result[column] = positions_found
+        return result
+
+class WildcardPatternSet:
+    """Набор шаблонов с джокерами, который ищется за один проход по тексту
+
+    Подшаблоны всех шаблонов (у каждого шаблона свой джокер) загружаются в
+    один общий автомат; каждый различный подшаблон помечен списком пар
+    (номер шаблона, смещение в шаблоне). Вхождение подшаблона голосует за
+    начало каждого шаблона, к которому оно относится, как в WildcardPattern.
+    Голоса хранятся в словаре по (начало, номер шаблона), поэтому память
+    пропорциональна числу вхождений подшаблонов, а не длине текста,
+    умноженной на число шаблонов.
+    """
+    def __init__(self, patterns, automaton, subpattern_tags, occurrences):
+        self.patterns = patterns                # Пары (шаблон, джокер)
+        self.automaton = automaton              # None, если подшаблонов нет
+        self.subpattern_tags = subpattern_tags  # (номер шаблона, смещение) по индексу подшаблона
+        self.occurrences = occurrences          # Число подшаблонов каждого шаблона
+        self.lengths = [len(pattern) for pattern, _ in patterns]
+
+    @classmethod
+    def compile(cls, patterns, observer=None):
+        """Построение общего автомата; номер шаблона - его индекс в patterns"""
+        patterns = list(patterns)
+        tags = {}  # Подшаблон -> список (номер шаблона, смещение)
+        occurrences = [0] * len(patterns)
+        for pattern_id, (pattern, wildcard) in enumerate(patterns):
+            for offset, subpattern in _split_wildcard_pattern(pattern, wildcard):
+                tags.setdefault(subpattern, []).append((pattern_id, offset))
+                occurrences[pattern_id] += 1
+
+        automaton = None
+        if tags:
+            automaton = AhoCorasick(observer)
+            for i, subpattern in enumerate(tags):
+                automaton.add_pattern(subpattern, i, len(subpattern))
+            automaton.build_failure_links()
+            if observer is None:
+                automaton.compile()
+        return cls(patterns, automaton, list(tags.values()), occurrences)
+
+    def search(self, text):
+        """Все вхождения шаблонов: пары (позиция 1-based, номер шаблона) по возрастанию"""
+        if self.automaton is None:
+            return []
+        subpattern_tags = self.subpattern_tags
+        occurrences = self.occurrences
+        last_starts = [len(text) - length for length in self.lengths]
+        n_patterns = len(self.patterns)
+        votes = {}  # start * n_patterns + номер шаблона -> число голосов
+        result = []
+        for pos, subpat_idx in self.automaton.search(text):
+            for pattern_id, offset in subpattern_tags[subpat_idx]:
+                start = pos - offset
+                if 0 <= start <= last_starts[pattern_id]:
+                    key = start * n_patterns + pattern_id
+                    count = votes.get(key, 0) + 1
+                    votes[key] = count
+                    if count == occurrences[pattern_id]:
+                        result.append((start + 1, pattern_id))
+        result.sort()
+        return result
+
+    def search_many(self, texts):
+        """Поиск набора в каждом тексте: список результатов search()"""
+        return [self.search(text) for text in texts]
+
+WILDCARD_METHODS = ('auto', 'aho-corasick', 'shift-and', 'fft')
+
+def _choose_wildcard_method(pattern, wildcard):
+    """Движок для method='auto'
+
+    Шаблоны не длиннее машинного слова ищет Shift-And. Из более длинных
+    БПФ выбирается для очень длинных шаблонов и шаблонов, в которых
+    джокеров не меньше половины (много коротких подшаблонов и вхождений),
+    если установлен numpy и алфавит шаблона укладывается в точность FFT.
+    """
+    if len(pattern) <= SHIFT_AND_MAX_LENGTH:
+        return 'shift-and'
+    dense = pattern.count(wildcard) * 2 >= len(pattern)
+    if not (dense or len(pattern) >= FFT_LONG_PATTERN_LENGTH):
+        return 'aho-corasick'
+    if importlib.util.find_spec('numpy') is None or not FFTWildcardPattern.fits(pattern, wildcard):
+        return 'aho-corasick'
+    return 'fft'
+
+def compile_wildcard(pattern, wildcard, method='auto'):
+    """Скомпилированный шаблон с джокерами выбранного движка
+
+    method - 'aho-corasick' (WildcardPattern), 'shift-and'
+    (ShiftAndWildcardPattern), 'fft' (FFTWildcardPattern) или 'auto'.
+    Все движки дают одинаковые результаты search().
+    """
+    if method == 'auto':
+        method = _choose_wildcard_method(pattern, wildcard)
+    if method == 'aho-corasick':
+        return WildcardPattern.compile(pattern, wildcard)
+    if method == 'shift-and':
+        return ShiftAndWildcardPattern.compile(pattern, wildcard)
+    if method == 'fft':
+        return FFTWildcardPattern.compile(pattern, wildcard)
+    raise ValueError(f"Неизвестный метод поиска с джокерами: {method!r}")
+
+WILDCARD_CACHE_SIZE = 256  # Сколько скомпилированных шаблонов хранит find_wildcard_matches
+
+@lru_cache(maxsize=WILDCARD_CACHE_SIZE)
+def _cached_wildcard_pattern(pattern, wildcard, method):
+    """Скомпилированный шаблон из LRU-кэша по ключу (шаблон, джокер, метод)"""
+    return compile_wildcard(pattern, wildcard, method)
+
+def find_wildcard_matches(text, pattern, wildcard, method='auto'):
+    """Поиск шаблонов с джокерами в тексте
+
+    Шаблон компилируется один раз для тройки (шаблон, джокер, метод) и
+    берётся из ограниченного LRU-кэша при повторных вызовах (см.
+    compile_wildcard).
+    """
+    return _cached_wildcard_pattern(pattern, wildcard, method).search(text)
+
+@lru_cache(maxsize=WILDCARD_CACHE_SIZE)
+def _cached_wildcard_pattern_set(patterns):
+    """Скомпилированный набор шаблонов из LRU-кэша по кортежу пар (шаблон, джокер)"""
+    return WildcardPatternSet.compile(patterns)
+
+def find_multi_wildcard_matches(text, patterns):
+    """Поиск многих шаблонов с джокерами за один проход по тексту
+
+    patterns - пары (шаблон, джокер). Возвращает пары (позиция 1-based,
+    номер шаблона в patterns), см. WildcardPatternSet.
+    """
+    return _cached_wildcard_pattern_set(tuple(map(tuple, patterns))).search(text)
+
+OUTPUT_BUFFER_SIZE = 1 << 20  # Буфер вывода пакетного режима
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Пакетный поиск шаблонов с джокерами. Каждая строка входа - "
+                    "отдельный текст. Без аргументов программа работает в интерактивном режиме.")
+    parser.add_argument('-p', '--patterns', metavar='FILE', required=True,
+                        help="файл шаблонов: строка 'шаблон' или 'шаблон<TAB>джокер' "
+                             "(номер шаблона - номер строки)")
+    parser.add_argument('inputs', nargs='*', metavar='INPUT',
+                        help="файлы для поиска ('-' или ничего - стандартный ввод)")
+    parser.add_argument('-w', '--wildcard', default='?',
+                        help="джокер для строк без явного джокера (по умолчанию '?')")
+    parser.add_argument('-m', '--method', choices=WILDCARD_METHODS, default='auto',
+                        help="движок для файла из одного шаблона (см. compile_wildcard); "
+                             "несколько шаблонов ищутся за один проход WildcardPatternSet")
+    parser.add_argument('-f', '--format', choices=('tsv', 'jsonl'), default='tsv',
+                        help="формат вывода: 'файл строка позиция шаблон' через табуляцию "
+                             "или JSON lines (по умолчанию tsv)")
+    parser.add_argument('-o', '--output', metavar='FILE', help="файл результатов (по умолчанию stdout)")
+    parser.add_argument('-e', '--encoding', default='utf-8', help="кодировка шаблонов и входа")
+    return parser.parse_args(argv)
+
+def run_batch(args):
+    """Пакетный режим: поиск в каждой строке входных файлов, результаты в TSV / JSON lines"""
+    started = time.perf_counter()
+    patterns = []  # (номер шаблона, шаблон, джокер)
+    with open(args.patterns, encoding=args.encoding) as f:
+        for i, line in enumerate(f, 1):
+            pattern, _, wildcard = line.rstrip('\r\n').partition('\t')
+            if pattern:
+                patterns.append((i, pattern, wildcard or args.wildcard))
+    if len(patterns) == 1:
+        compiled = compile_wildcard(patterns[0][1], patterns[0][2], args.method)
+        number = patterns[0][0]
+        search = lambda text: [(pos, number) for pos in compiled.search(text)]
+    else:
+        compiled = WildcardPatternSet.compile((pattern, wildcard) for _, pattern, wildcard in patterns)
+        numbers = [number for number, _, _ in patterns]
+        search = lambda text: [(pos, numbers[i]) for pos, i in compiled.search(text)]
+    build_time = time.perf_counter() - started
+
+    output = (open(args.output, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+              if args.output else sys.stdout)
+    write = output.write
+    scanned = 0
+    found = 0
+    started = time.perf_counter()
+    try:
+        for name in args.inputs or ['-']:
+            f = sys.stdin.buffer if name == '-' else open(name, 'rb')
+            try:
+                for line_no, raw in enumerate(f, 1):
+                    scanned += len(raw)
+                    text = raw.decode(args.encoding).rstrip('\r\n')
+                    for pos, number in search(text):
+                        if args.format == 'tsv':
+                            write(f"{name}\t{line_no}\t{pos}\t{number}\n")
+                        else:
+                            write(json.dumps({'file': name, 'line': line_no, 'pos': pos,
+                                              'pattern': number}, ensure_ascii=False) + '\n')
+                        found += 1
+            finally:
+                if f is not sys.stdin.buffer:
+                    f.close()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+    elapsed = time.perf_counter() - started
+    megabytes = scanned / 1e6
+    print(f"Шаблонов: {len(patterns)}, подготовлены за {build_time:.3f} с; "
+          f"просмотрено {megabytes:.2f} МБ за {elapsed:.3f} с "
+          f"({megabytes / elapsed if elapsed else 0:.2f} МБ/с), совпадений: {found}",
+          file=sys.stderr)
+
+def main(argv=None):
+    """Основная функция: пакетный режим при наличии аргументов, иначе диалог"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_batch(_parse_args(argv))
+
     print("Введите текст:")
     text = sys.stdin.readline().strip()
     print("Введите шаблон:")
@@ -278,7 +1140,17 @@ def main():
     
     print("\n" + "="*50)
     print("Начало выполнения программы")
-    matches = find_wildcard_matches(text, pattern, wildcard)
+    print(f"Текст: '{text}'\nШаблон: '{pattern}'\nДжокер: '{wildcard}'")
+
+    # Построение автомата подшаблонов и поиск с печатью каждого шага
+    compiled = WildcardPattern.compile(pattern, wildcard, observer=print_trace)
+    if compiled.automaton is None:
+        print("Нет подшаблонов для поиска")
+    matches = compiled.search(text)
+
+    # Анализ цепочек автомата подшаблонов
+    if compiled.automaton is not None:
+        compiled.automaton.get_longest_chains()
     
     print("\nРезультат:")
     if matches:
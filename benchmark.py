@@ -0,0 +1,345 @@
+"""Замеры производительности автоматов Ахо-Корасик
+
+Набор синтетических нагрузок (ДНК, текст на естественном языке, большой
+словарь, вложенные шаблоны с длинными цепочками ссылок, шаблоны с
+джокерами) для AhoKorasik, CompactAhoKorasik, AhoCorasick и поиска с
+джокерами. Для каждого замера печатаются время построения, скорость
+поиска в МБ/с, пиковая память построения (tracemalloc), число состояний
+на шаблон и число совпадений.
+
+Результаты сравниваются с базовыми значениями из benchmark_baselines.json:
+время построения и память не должны вырасти, а скорость поиска - упасть
+больше чем на --tolerance, число совпадений и состояний должно совпасть
+точно. Времена зависят от машины, поэтому базовые значения обновляются
+на той машине, где проверяются регрессии.
+
+Запуск:
+    python benchmark.py                     # замер и проверка базовых значений
+    python benchmark.py --update-baselines  # замер и сохранение базовых значений
+    python benchmark.py --full              # словарь из 10^6 шаблонов вместо 10^5
+                                            # (только CompactAhoKorasik)
+    python benchmark.py --tracing           # цена трассировки (см. bench_tracing)
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+from aho_korasik_task1 import AhoKorasik, CompactAhoKorasik
+from aho_korasik_task2 import (AhoCorasick, WildcardPatternSet, compile_wildcard,
+                               find_wildcard_matches)
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'benchmark_baselines.json')
+DEFAULT_TOLERANCE = 0.5  # Допустимое ухудшение времени, скорости и памяти
+
+# Метрика -> (направление, абсолютный допуск): направление 1 - чем больше,
+# тем лучше, -1 - чем меньше, 0 - должна совпадать точно. Абсолютный допуск
+# не даёт шуму в замерах порядка миллисекунд считаться регрессией
+METRICS = {
+    'build_s': (-1, 0.005),
+    'search_mb_s': (1, 0),
+    'peak_mb': (-1, 0.05),
+    'states_per_pattern': (0, 0),
+    'matches': (0, 0),
+}
+
+def _best_time(func, repeat=5):
+    """Лучшее время одного вызова func из repeat попыток"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def _ignore(event):
+    """Наблюдатель, который ничего не делает (цена самих событий)"""
+
+def _reference_node_search(automaton, text):
+    """Эталонная копия поиска по бору без какой-либо трассировки"""
+    root = automaton.root
+    node = root
+    matches = []
+    for i, char in enumerate(text):
+        while node is not root and char not in node.children:
+            node = node.fail
+        node = node.children.get(char, root)
+        out_node = node if node.output else node.output_link
+        while out_node is not None:
+            for pattern_index, pattern_len in out_node.output:
+                matches.append((i - pattern_len + 2, pattern_index))
+            out_node = out_node.output_link
+    return matches
+
+def _reference_table_search(automaton, text):
+    """Эталонная копия поиска по таблице переходов без какой-либо трассировки"""
+    delta = automaton.delta
+    k = automaton.n_columns
+    column = automaton.alphabet.get
+    out_start = automaton.out_start
+    out_patterns = automaton.out_patterns
+    out_lengths = automaton.out_lengths
+    out_first = automaton.out_first
+    out_link = automaton.out_link
+    state = 0
+    matches = []
+    for i, char in enumerate(text):
+        state = delta[state * k + column(char, 0)]
+        report = out_first[state]
+        while report >= 0:
+            for j in range(out_start[report], out_start[report + 1]):
+                matches.append((i - out_lengths[j] + 2, out_patterns[j]))
+            report = out_link[report]
+    return matches
+
+def bench_tracing(text_size=200_000, n_patterns=500, seed=1):
+    """Цена трассировки: поиск без наблюдателя против эталонного цикла
+
+    Для каждого автомата сравниваются search() без наблюдателя, независимая
+    копия того же цикла без трассировки (_reference_node_search,
+    _reference_table_search) и search() с пустым наблюдателем. Первые два
+    времени должны совпадать с точностью до шума: поддержка наблюдателя не
+    должна замедлять поиск без него.
+    """
+    rng = random.Random(seed)
+    text = ''.join(rng.choice('acgt') for _ in range(text_size))
+    patterns = [''.join(rng.choice('acgt') for _ in range(rng.randint(3, 8)))
+                for _ in range(n_patterns)]
+
+    ak = AhoKorasik()
+    for i, pattern in enumerate(patterns, 1):
+        ak.add_pattern(pattern, i)
+    ak.build_fail_links()
+
+    ac = AhoCorasick()
+    for i, pattern in enumerate(patterns):
+        ac.add_pattern(pattern, i, len(pattern))
+    ac.build_failure_links()
+
+    def row(name, automaton, reference):
+        disabled = _best_time(lambda: automaton.search(text))
+        direct = _best_time(lambda: reference(automaton, text))
+        automaton.observer = _ignore
+        traced = _best_time(lambda: automaton.search(text), repeat=1)
+        automaton.observer = None
+        print(f"{name:<28} {disabled:>10.3f} {direct:>12.3f} {traced:>12.3f}")
+
+    print(f"Текст: {text_size} символов, шаблонов: {n_patterns}")
+    print(f"{'Поиск':<28} {'без набл., с':>10} {'эталон, с':>12} {'пустой набл., с':>12}")
+    row("AhoKorasik (бор)", ak, _reference_node_search)
+    row("AhoCorasick (бор)", ac, _reference_node_search)
+    ak.compile()
+    row("AhoKorasik (таблица)", ak, _reference_table_search)
+    ac.compile()
+    row("AhoCorasick (таблица)", ac, _reference_table_search)
+
+# Синтетические нагрузки: функция (rng, scale) -> (шаблоны, текст)
+
+def _random_string(rng, alphabet, low, high):
+    return ''.join(rng.choices(alphabet, k=rng.randint(low, high)))
+
+def dna_workload(rng, scale):
+    """4-буквенный алфавит: много коротких пересекающихся совпадений"""
+    patterns = [_random_string(rng, 'acgt', 8, 16) for _ in range(1000)]
+    text = ''.join(rng.choices('acgt', k=1_000_000))
+    return patterns, text
+
+def natural_language_workload(rng, scale):
+    """Слова из слогов с частотами по закону Ципфа, шаблоны - часть словаря"""
+    syllables = ['ka', 'to', 'ri', 'ne', 'ma', 'so', 'lu', 'de', 'vi', 'an', 'or', 'el',
+                 'st', 'pr', 'ch', 'ye', 'zo', 'mi', 'ku', 'ba']
+    vocabulary = sorted({''.join(rng.choices(syllables, k=rng.randint(1, 4)))
+                         for _ in range(20_000)})
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    words = rng.choices(vocabulary, weights, k=200_000)
+    patterns = rng.sample(vocabulary, 2000)
+    return patterns, ' '.join(words)
+
+def dictionary_workload(rng, scale):
+    """Большой словарь случайных слов (10^5 или 10^6 шаблонов при --full)"""
+    n_patterns = 1_000_000 if scale == 'full' else 100_000
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    patterns = [_random_string(rng, alphabet, 6, 12) for _ in range(n_patterns)]
+    text = ''.join(rng.choices(alphabet + ' ', k=1_000_000))
+    return patterns, text
+
+def nested_workload(rng, scale):
+    """Вложенные шаблоны a, aa, aaa, ...: fail- и output-цепочки длины m"""
+    patterns = ['a' * length for length in range(1, 51)] + ['a' * length + 'b' for length in range(50)]
+    text = ('a' * 500 + 'b') * 40
+    return patterns, text
+
+AUTOMATON_WORKLOADS = {
+    'dna': (dna_workload, ('AhoKorasik', 'CompactAhoKorasik', 'AhoCorasick')),
+    'natural': (natural_language_workload, ('AhoKorasik', 'CompactAhoKorasik', 'AhoCorasick')),
+    'dictionary': (dictionary_workload, ('AhoKorasik', 'CompactAhoKorasik', 'AhoCorasick')),
+    'nested': (nested_workload, ('AhoKorasik', 'CompactAhoKorasik', 'AhoCorasick')),
+}
+# Реализации, которые замеряются при --full: бор на Node для 10^6 шаблонов
+# (около 6 * 10^6 состояний) занимает несколько ГБ, а плотная таблица
+# переходов - ещё около 0.7 ГБ на копию, поэтому большой словарь строит
+# только CompactAhoKorasik
+FULL_SCALE_IMPLEMENTATIONS = {'dictionary': ('CompactAhoKorasik',)}
+
+def _build(name, patterns):
+    """Построение и компиляция автомата по имени класса"""
+    if name == 'AhoCorasick':
+        automaton = AhoCorasick()
+        for i, pattern in enumerate(patterns):
+            automaton.add_pattern(pattern, i, len(pattern))
+        automaton.build_failure_links()
+    else:
+        automaton = (AhoKorasik if name == 'AhoKorasik' else CompactAhoKorasik)()
+        for i, pattern in enumerate(patterns, 1):
+            automaton.add_pattern(pattern, i)
+        automaton.build_fail_links()
+    automaton.compile()
+    return automaton
+
+def _peak_mb(func):
+    """Пиковый объём памяти (МБ), выделенной во время вызова func"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def _measure(build, search, text, n_patterns, repeat):
+    """Метрики одного замера: build() -> объект, search(объект) -> совпадения"""
+    build_s = _best_time(build, repeat=repeat)
+    peak_mb = _peak_mb(build)
+    compiled = build()
+    matches = search(compiled)
+    search_s = _best_time(lambda: search(compiled), repeat=repeat)
+    automaton = getattr(compiled, 'automaton', compiled)  # Автомат подшаблонов
+    states = len(automaton.fail) if getattr(automaton, 'fail', None) is not None else 0
+    return {
+        'build_s': round(build_s, 4),
+        'search_mb_s': round(len(text.encode('utf-8')) / 1e6 / search_s, 3),
+        'peak_mb': round(peak_mb, 2),
+        'states_per_pattern': round(states / n_patterns, 3),
+        'matches': len(matches),
+    }
+
+def wildcard_benchmarks(rng, repeat):
+    """Поиск с джокерами всеми движками, через find_wildcard_matches
+    (auto-выбор движка и кэш скомпилированных шаблонов) и набором шаблонов
+    за один проход"""
+    text = ''.join(rng.choices('acgt', k=200_000))
+    cases = {
+        'short': 'a?g??t?c',
+        'dense': ''.join(rng.choice('acgt??????') for _ in range(200)),
+        'long': ''.join(rng.choice('acgt?') for _ in range(2000)),
+    }
+    methods = ['aho-corasick', 'shift-and']
+    if importlib.util.find_spec('numpy') is not None:
+        methods.append('fft')
+        # Первый импорт numpy и numpy.fft занимает доли секунды и при
+        # --repeat 1 попал бы во время построения первого FFT-замера
+        compile_wildcard('a?', '?', 'fft').search('acgt')
+    results = {}
+    for case, pattern in cases.items():
+        for method in methods:
+            if method == 'shift-and' and len(pattern) > 64:
+                continue
+            results[f'wildcard/{case}/{method}'] = _measure(
+                lambda: compile_wildcard(pattern, '?', method),
+                lambda compiled: compiled.search(text), text, 1, repeat)
+        # Построение скрыто в кэше find_wildcard_matches и входит в первый вызов
+        results[f'wildcard/{case}/find_wildcard_matches'] = _measure(
+            lambda: pattern,
+            lambda pattern: find_wildcard_matches(text, pattern, '?'), text, 1, repeat)
+
+    patterns = [(''.join(rng.choice('acgt??') for _ in range(rng.randint(6, 20))), '?')
+                for _ in range(200)]
+    results['wildcard/set-200/aho-corasick'] = _measure(
+        lambda: WildcardPatternSet.compile(patterns),
+        lambda compiled: compiled.search(text), text, len(patterns), repeat)
+    return results
+
+def run_suite(scale='default', repeat=3, seed=1):
+    """Все замеры: {'нагрузка/реализация': метрики}"""
+    results = {}
+    for workload, (make, implementations) in AUTOMATON_WORKLOADS.items():
+        if scale == 'full':
+            implementations = FULL_SCALE_IMPLEMENTATIONS.get(workload, implementations)
+        patterns, text = make(random.Random(seed), scale)
+        for name in implementations:
+            key = f'{workload}/{name}'
+            print(f"  {key}...", file=sys.stderr)
+            results[key] = _measure(lambda: _build(name, patterns),
+                                    lambda automaton: automaton.search(text),
+                                    text, len(patterns), repeat)
+    print("  wildcard...", file=sys.stderr)
+    results.update(wildcard_benchmarks(random.Random(seed), repeat))
+    return results
+
+def print_results(results):
+    print(f"{'Замер':<40} {'постр., с':>10} {'МБ/с':>9} {'память, МБ':>11} "
+          f"{'сост./шабл.':>12} {'совпадений':>11}")
+    for key, metrics in results.items():
+        print(f"{key:<40} {metrics['build_s']:>10.3f} {metrics['search_mb_s']:>9.2f} "
+              f"{metrics['peak_mb']:>11.2f} {metrics['states_per_pattern']:>12.2f} "
+              f"{metrics['matches']:>11}")
+
+def check_baselines(results, baselines, tolerance=DEFAULT_TOLERANCE):
+    """Список описаний регрессий относительно базовых значений"""
+    regressions = []
+    for key, metrics in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        for metric, (direction, slack) in METRICS.items():
+            old, new = baseline.get(metric), metrics[metric]
+            if old is None:
+                continue
+            if direction == 0:
+                worse = new != old
+            elif direction > 0:
+                worse = new < old * (1 - tolerance) - slack
+            else:
+                worse = new > old * (1 + tolerance) + slack
+            if worse:
+                regressions.append(f"{key}: {metric} {old} -> {new}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности автоматов Ахо-Корасик")
+    parser.add_argument('--update-baselines', action='store_true',
+                        help="сохранить результаты как базовые значения")
+    parser.add_argument('--baselines', default=BASELINES_PATH, help="файл базовых значений")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое относительное ухудшение (по умолчанию 0.5)")
+    parser.add_argument('--full', action='store_true', help="словарь из 10^6 шаблонов")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов каждого замера")
+    parser.add_argument('--tracing', action='store_true', help="только замер цены трассировки")
+    args = parser.parse_args(argv)
+
+    if args.tracing:
+        bench_tracing()
+        return 0
+
+    results = run_suite('full' if args.full else 'default', args.repeat)
+    print_results(results)
+    if args.update_baselines:
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nБазовые значения сохранены в {args.baselines}")
+        return 0
+    if not os.path.exists(args.baselines):
+        print(f"\nНет файла базовых значений {args.baselines} (см. --update-baselines)")
+        return 0
+    with open(args.baselines, encoding='utf-8') as f:
+        regressions = check_baselines(results, json.load(f), args.tolerance)
+    if regressions:
+        print("\nРегрессии:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nРегрессий нет")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())